@@ -38,6 +38,11 @@ def parse_args() -> argparse.Namespace:
         "--output-dir",
         help="Каталог, куда положить сгенерированные спецификации.",
     )
+    parser.add_argument(
+        "--force-download-background",
+        action="store_true",
+        help="Скачивать фон перед ffprobe, а не читать метаданные по URL (для хостов, где ffprobe по ссылке не работает).",
+    )
     parser.add_argument(
         "--fit-tolerance",
         type=float,
@@ -2,4 +2,4 @@
 Общие модули и утилиты, используемые несколькими подсистемами.
 """
 
-__all__ = ["media"]
+__all__ = ["http", "jsonio", "media"]
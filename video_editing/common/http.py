@@ -0,0 +1,115 @@
+"""
+Лёгкие HTTP-хелперы для скачивания исходников: общая keep-alive сессия
+и загрузка параллельными Range-запросами.
+
+Модуль зависит только от requests, чтобы overlay-билдер и пайплайн могли
+скачивать файлы, не импортируя тяжёлый prepare_overlay (cv2/mediapipe).
+"""
+from __future__ import annotations
+
+import logging
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import IO
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+PARALLEL_DOWNLOAD_MIN_BYTES = 8 * 1024 * 1024
+PARALLEL_DOWNLOAD_CHUNKS = 4
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+@lru_cache(maxsize=1)
+def http_session() -> requests.Session:
+    # Одна keep-alive сессия на процесс для скачивания, ingest API и опроса
+    # ассета: повторные запросы к тем же хостам идут без TLS-handshake.
+    # Пул покрывает параллельные Range-запросы; повторы только у GET/HEAD.
+    session = requests.Session()
+    retries = Retry(total=3, backoff_factor=0.5, allowed_methods=frozenset({"GET", "HEAD"}))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(8, PARALLEL_DOWNLOAD_CHUNKS), max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _copy_response(response: requests.Response, handle: IO[bytes]) -> None:
+    """Переложить тело ответа в файл мегабайтными блоками через shutil без цикла на Python."""
+    response.raw.decode_content = True
+    shutil.copyfileobj(response.raw, handle, length=DOWNLOAD_CHUNK_BYTES)
+
+
+def download_file(url: str, dest: Path) -> None:
+    start_time = time.time()
+
+    with http_session().get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(dest, "wb") as handle:
+            _copy_response(response, handle)
+            downloaded_bytes = handle.tell()
+
+    duration = time.time() - start_time
+    size_mb = downloaded_bytes / (1024 * 1024)
+    logger.info(f"[HTTP] ⏱️ Downloaded {size_mb:.1f}MB in {duration:.2f}s")
+
+
+def _download_range(url: str, dest: Path, start: int, end: int) -> int:
+    """Скачать байты [start, end] в уже размеченный файл по своему смещению."""
+    with http_session().get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise RuntimeError(f"Server ignored Range request (status {response.status_code})")
+        with open(dest, "r+b") as handle:
+            handle.seek(start)
+            _copy_response(response, handle)
+            written = handle.tell() - start
+    expected = end - start + 1
+    if written != expected:
+        raise RuntimeError(f"Incomplete range {start}-{end}: got {written} of {expected} bytes")
+    return written
+
+
+def parallel_download(url: str, dest: Path, chunks: int = PARALLEL_DOWNLOAD_CHUNKS) -> None:
+    """
+    Скачать файл несколькими параллельными Range-запросами.
+    Если сервер не поддерживает Range или файл маленький — обычный download_file.
+    """
+    try:
+        head = http_session().head(url, allow_redirects=True, timeout=30)
+        head.raise_for_status()
+        size = int(head.headers.get("Content-Length") or 0)
+        accepts_ranges = head.headers.get("Accept-Ranges", "").lower() == "bytes"
+        resolved_url = head.url or url
+    except (requests.RequestException, ValueError):
+        size = 0
+        accepts_ranges = False
+        resolved_url = url
+
+    if chunks <= 1 or not accepts_ranges or size < PARALLEL_DOWNLOAD_MIN_BYTES:
+        download_file(url, dest)
+        return
+
+    start_time = time.time()
+    part_size = -(-size // chunks)
+    ranges = [(offset, min(offset + part_size, size) - 1) for offset in range(0, size, part_size)]
+    with open(dest, "wb") as handle:
+        handle.truncate(size)
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(_download_range, resolved_url, dest, start, end) for start, end in ranges]
+            downloaded_bytes = sum(future.result() for future in futures)
+    except (requests.RequestException, RuntimeError, OSError) as exc:
+        logger.warning(f"[HTTP] ⚠️ Parallel download failed ({exc}), falling back to single stream")
+        download_file(url, dest)
+        return
+
+    duration = time.time() - start_time
+    size_mb = downloaded_bytes / (1024 * 1024)
+    logger.info(f"[HTTP] ⏱️ Downloaded {size_mb:.1f}MB in {duration:.2f}s ({len(ranges)} parallel ranges)")
+
@@ -0,0 +1,55 @@
+"""
+Быстрый JSON (de)serializer: orjson, если установлен, иначе stdlib json.
+
+Все функции работают с bytes, чтобы запись и чтение шли одним вызовом
+без промежуточного текстового буфера.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Union
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency, stdlib fallback
+    orjson = None  # type: ignore
+
+PathLike = Union[str, Path]
+
+# orjson.JSONDecodeError наследуется от json.JSONDecodeError, поэтому
+# одного типа достаточно для обоих бэкендов.
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any, *, indent: bool = False) -> bytes:
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(value, option=option)
+    return json.dumps(value, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
+
+
+def read_json(path: PathLike) -> Any:
+    return loads(Path(path).read_bytes())
+
+
+def write_json(value: Any, path: PathLike, *, indent: bool = True) -> None:
+    """Атомарно записать JSON: один write во временный файл и os.replace поверх цели."""
+    target = Path(path)
+    data = dumps(value, indent=indent)
+    tmp_path = target.with_name(f"{target.name}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
@@ -2,6 +2,7 @@ from .meta import (
     MediaMeta,
     decide_fit,
     run_ffprobe_meta,
+    run_ffprobe_meta_url,
     sniff_remote_media_type,
 )
 
@@ -9,5 +10,6 @@ __all__ = [
     "MediaMeta",
     "decide_fit",
     "run_ffprobe_meta",
+    "run_ffprobe_meta_url",
     "sniff_remote_media_type",
 ]
@@ -1,37 +1,216 @@
 from __future__ import annotations
 
-import io
-import json
+import hashlib
+import os
+import shutil
 import subprocess
-from dataclasses import dataclass
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Type
+from typing import Any, Callable, Dict, Optional, Tuple, Type
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image  # type: ignore
 
-from video_editing.render.shotstack import ShotstackError, probe_duration
+from .. import jsonio
 
-IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tiff"}
-VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v", ".webm", ".mkv", ".avi", ".mpg", ".mpeg"}
+try:
+    import av  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency, ffprobe fallback
+    av = None  # type: ignore
 
+IMAGE_EXTENSIONS = frozenset({".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tiff"})
+VIDEO_EXTENSIONS = frozenset({".mp4", ".mov", ".m4v", ".webm", ".mkv", ".avi", ".mpg", ".mpeg"})
 
-@dataclass
+META_CACHE_DIR = Path(
+    os.getenv("MEDIA_META_CACHE_DIR", str(Path.home() / ".cache" / "genai-ugc-bot" / "meta"))
+)
+# Сколько записей держит дисковый кеш; лишние удаляются по давности использования (mtime).
+META_CACHE_MAX_ENTRIES = max(1, int(os.getenv("MEDIA_META_CACHE_MAX_ENTRIES", "512")))
+
+
+@dataclass(frozen=True, slots=True)
 class MediaMeta:
+    # Экземпляры кешируются и отдаются нескольким вызывающим, поэтому неизменяемы.
     asset_type: str
     width: int
     height: int
     duration: float
 
 
+IMAGE_HEADER_CHUNK = 4096
+
+
 def _probe_image_meta(path: Path) -> Optional[MediaMeta]:
+    """
+    Размер изображения по заголовку. Видео-контейнеры отсекаются по сигнатуре
+    без Pillow; Image.open лениво читает только заголовок, без декодирования.
+    """
     try:
+        with open(path, "rb") as handle:
+            if _magic_media_type(handle.read(IMAGE_HEADER_CHUNK)) == "video":
+                return None
         with Image.open(path) as img:
             width, height = img.size
-        return MediaMeta(asset_type="image", width=int(width), height=int(height), duration=0.0)
-    except (OSError, ValueError):
+    except (OSError, ValueError, SyntaxError):
+        return None
+    return MediaMeta(asset_type="image", width=int(width), height=int(height), duration=0.0)
+
+
+def _probe_av_meta(path: Path) -> Optional[MediaMeta]:
+    """
+    Метаданные видео через PyAV в текущем процессе: тот же парсер контейнеров
+    libavformat, что и в ffprobe, но без fork/exec и JSON. None — пусть решает ffprobe.
+    """
+    if av is None:
+        return None
+    try:
+        with av.open(str(path)) as container:
+            if not container.streams.video:
+                return None
+            stream = container.streams.video[0]
+            width = int(stream.codec_context.width)
+            height = int(stream.codec_context.height)
+            if container.duration is not None:
+                duration = float(container.duration) / av.time_base
+            elif stream.duration is not None and stream.time_base is not None:
+                duration = float(stream.duration * stream.time_base)
+            else:
+                return None
+    except Exception:  # noqa: BLE001 - любые ошибки libav означают fallback на ffprobe
+        return None
+    if width <= 0 or height <= 0:
+        return None
+    return MediaMeta(asset_type="video", width=width, height=height, duration=duration)
+
+
+def _payload_duration(payload: Dict[str, Any]) -> Optional[float]:
+    """Длительность из ответа ffprobe: format.duration, как раньше в probe_duration, иначе stream.duration."""
+    candidates = [payload.get("format", {}).get("duration")]
+    streams = payload.get("streams") or []
+    if streams:
+        candidates.append(streams[0].get("duration"))
+    for value in candidates:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+FFPROBE_META_ARGS = (
+    "-v",
+    "error",
+    "-select_streams",
+    "v:0",
+    "-show_entries",
+    "stream=width,height,duration:format=duration",
+    "-of",
+    "json",
+)
+
+
+@lru_cache(maxsize=1)
+def _ffprobe_bin() -> str:
+    # Абсолютный путь ищется один раз: без поиска по PATH на каждый вызов,
+    # и subprocess может запустить процесс через posix_spawn вместо fork+exec.
+    return shutil.which("ffprobe") or "ffprobe"
+
+
+def _run_ffprobe_meta_command(
+    target: str,
+    *,
+    timeout: Optional[float] = None,
+) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [_ffprobe_bin(), *FFPROBE_META_ARGS, target],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+        timeout=timeout,
+        close_fds=False,
+    )
+
+
+def _decode_output(output: Optional[bytes]) -> str:
+    # Вывод ffprobe остаётся bytes: JSON парсится напрямую, текст декодируется только для ошибок.
+    return (output or b"").decode("utf-8", errors="replace").strip()
+
+
+_META_MEMO: Dict[str, MediaMeta] = {}
+
+
+def _meta_cache_key(*parts: object) -> str:
+    return hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def _load_cached_meta(key: str) -> Optional[MediaMeta]:
+    meta = _META_MEMO.get(key)
+    if meta is not None:
+        return meta
+    cache_path = META_CACHE_DIR / f"{key}.json"
+    try:
+        data = jsonio.read_json(cache_path)
+        meta = MediaMeta(
+            asset_type=str(data["asset_type"]),
+            width=int(data["width"]),
+            height=int(data["height"]),
+            duration=float(data["duration"]),
+        )
+    except (OSError, jsonio.JSONDecodeError, KeyError, TypeError, ValueError):
         return None
+    try:
+        # Попадание обновляет mtime: вытесняются давно не использованные записи.
+        os.utime(cache_path)
+    except OSError:
+        pass
+    _META_MEMO[key] = meta
+    return meta
+
+
+def _store_cached_meta(key: str, meta: MediaMeta, *, persist: bool = True) -> None:
+    _META_MEMO[key] = meta
+    if not persist:
+        return
+    try:
+        META_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        jsonio.write_json(asdict(meta), META_CACHE_DIR / f"{key}.json", indent=False)
+        _prune_meta_cache()
+    except OSError:
+        # Дисковый кеш — оптимизация; недоступный каталог не должен ломать пайплайн.
+        pass
+
+
+def _prune_meta_cache() -> None:
+    """Оставить в META_CACHE_DIR не больше META_CACHE_MAX_ENTRIES самых свежих записей."""
+    entries = []
+    with os.scandir(META_CACHE_DIR) as scan:
+        for entry in scan:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime_ns, entry.path))
+            except OSError:
+                continue
+    if len(entries) <= META_CACHE_MAX_ENTRIES:
+        return
+    entries.sort()
+    for _, stale_path in entries[: len(entries) - META_CACHE_MAX_ENTRIES]:
+        try:
+            os.unlink(stale_path)
+        except OSError:
+            pass
+
+
+@lru_cache(maxsize=1)
+def _temp_root() -> Path:
+    return Path(tempfile.gettempdir()).resolve()
 
 
 def run_ffprobe_meta(
@@ -39,50 +218,138 @@ def run_ffprobe_meta(
     *,
     error_cls: Type[Exception] = RuntimeError,
 ) -> MediaMeta:
-    image_meta = _probe_image_meta(media_path)
-    if image_meta is not None:
-        return image_meta
-
-    command = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-select_streams",
-        "v:0",
-        "-show_entries",
-        "stream=width,height",
-        "-of",
-        "json",
-        str(media_path),
-    ]
+    """
+    Метаданные локального файла с кешем по (путь, mtime, размер): в памяти
+    процесса и на диске в META_CACHE_DIR. Изменённый файл получает новый ключ.
+    Файлы во временном каталоге (скачанные исходники) на диск не пишутся:
+    их пути уникальны на запуск, и такие записи никогда не были бы прочитаны.
+    """
+    try:
+        stat = media_path.stat()
+    except OSError:
+        return _probe_media_meta(media_path, error_cls=error_cls)
+    resolved = media_path.resolve()
+    key = _meta_cache_key("file", resolved, stat.st_mtime_ns, stat.st_size)
+    cached = _load_cached_meta(key)
+    if cached is not None:
+        return cached
+    meta = _probe_media_meta(media_path, error_cls=error_cls)
+    _store_cached_meta(key, meta, persist=not resolved.is_relative_to(_temp_root()))
+    return meta
+
+
+# Быстрые пробы по порядку; каждая вызывается ровно один раз и возвращает None,
+# если файл не её. ffprobe — последний и единственный, кто поднимает ошибку.
+_LOCAL_PROBES: Tuple[Callable[[Path], Optional[MediaMeta]], ...] = (
+    _probe_image_meta,
+    _probe_av_meta,
+)
+
+
+def _probe_media_meta(
+    media_path: Path,
+    *,
+    error_cls: Type[Exception],
+) -> MediaMeta:
+    for probe in _LOCAL_PROBES:
+        meta = probe(media_path)
+        if meta is not None:
+            return meta
+    return _probe_ffprobe_meta(media_path, error_cls=error_cls)
+
+
+def _probe_ffprobe_meta(
+    media_path: Path,
+    *,
+    error_cls: Type[Exception],
+) -> MediaMeta:
     try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        result = _run_ffprobe_meta_command(str(media_path))
     except FileNotFoundError as exc:
         raise error_cls("Нужен ffprobe, но бинарь не найден в PATH.") from exc
     except subprocess.CalledProcessError as exc:
-        image_meta = _probe_image_meta(media_path)
-        if image_meta is not None:
-            return image_meta
-        raise error_cls(f"ffprobe не смог прочитать {media_path}: {exc.stderr.strip()}") from exc
+        raise error_cls(f"ffprobe не смог прочитать {media_path}: {_decode_output(exc.stderr)}") from exc
 
     try:
-        payload = json.loads(result.stdout)
+        payload = jsonio.loads(result.stdout)
         stream = payload["streams"][0]
         width = int(stream["width"])
         height = int(stream["height"])
     except (KeyError, ValueError, IndexError) as exc:
-        image_meta = _probe_image_meta(media_path)
-        if image_meta is not None:
-            return image_meta
-        raise error_cls(f"Не удалось распарсить метаданные ffprobe: {result.stdout}") from exc
+        raise error_cls(f"Не удалось распарсить метаданные ffprobe: {_decode_output(result.stdout)}") from exc
+
+    duration = _payload_duration(payload)
+    if duration is None:
+        raise error_cls(f"ffprobe не вернул длительность для {media_path}: {_decode_output(result.stdout)}")
+    return MediaMeta(asset_type="video", width=width, height=height, duration=duration)
+
+
+def run_ffprobe_meta_url(
+    url: str,
+    *,
+    error_cls: Type[Exception] = RuntimeError,
+    timeout: float = 60.0,
+) -> MediaMeta:
+    """
+    Прочитать метаданные удалённого файла, передав URL прямо в ffprobe.
+    ffprobe читает только заголовки контейнера, поэтому полное скачивание не нужно.
+    Результат кешируется по (URL, размер, ETag/Last-Modified), если сервер их отдаёт.
+    """
+    key = _remote_cache_key(url)
+    if key is not None:
+        cached = _load_cached_meta(key)
+        if cached is not None:
+            return cached
+    meta = _probe_remote_meta(url, error_cls=error_cls, timeout=timeout)
+    if key is not None:
+        _store_cached_meta(key, meta)
+    return meta
+
+
+def _remote_cache_key(url: str) -> Optional[str]:
+    """Ключ кеша для URL; None, если сервер не даёт валидаторов и изменение файла не отследить."""
+    try:
+        response = _http_session().head(url, allow_redirects=True, timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    size = response.headers.get("Content-Length")
+    validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+    if not size or not validator:
+        return None
+    return _meta_cache_key("url", url, size, validator)
+
+
+def _probe_remote_meta(
+    url: str,
+    *,
+    error_cls: Type[Exception],
+    timeout: float,
+) -> MediaMeta:
+    asset_type = sniff_remote_media_type(url, error_cls=error_cls)
+    try:
+        result = _run_ffprobe_meta_command(url, timeout=timeout)
+    except FileNotFoundError as exc:
+        raise error_cls("Нужен ffprobe, но бинарь не найден в PATH.") from exc
+    except subprocess.CalledProcessError as exc:
+        raise error_cls(f"ffprobe не смог прочитать {url}: {_decode_output(exc.stderr)}") from exc
+    except subprocess.TimeoutExpired as exc:
+        raise error_cls(f"ffprobe не ответил за {timeout:.0f}s для {url}") from exc
 
     try:
-        duration = probe_duration(str(media_path))
-    except ShotstackError:
-        image_meta = _probe_image_meta(media_path)
-        if image_meta is not None:
-            return image_meta
-        raise
+        payload = jsonio.loads(result.stdout)
+        stream = payload["streams"][0]
+        width = int(stream["width"])
+        height = int(stream["height"])
+    except (KeyError, ValueError, IndexError) as exc:
+        raise error_cls(f"Не удалось распарсить метаданные ffprobe: {_decode_output(result.stdout)}") from exc
+
+    if asset_type == "image":
+        return MediaMeta(asset_type="image", width=width, height=height, duration=0.0)
+
+    duration = _payload_duration(payload)
+    if duration is None:
+        raise error_cls(f"ffprobe не вернул длительность для {url}")
     return MediaMeta(asset_type="video", width=width, height=height, duration=duration)
 
 
@@ -97,6 +364,64 @@ def _content_type_to_media_type(content_type: Optional[str]) -> Optional[str]:
     return None
 
 
+@lru_cache(maxsize=1)
+def _http_session() -> requests.Session:
+    # Одна сессия на процесс: HEAD и Range GET к тому же хосту идут по уже
+    # открытому keep-alive соединению без повторного TLS-handshake.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+SNIFF_BYTES = 4096
+
+
+# Сигнатуры в начале файла. RIFF и ISO-BMFF (ftyp) разбираются отдельно:
+# у них тип определяется не префиксом, а полем формата/бренда.
+_PREFIX_MAGICS = (
+    (b"\x89PNG\r\n\x1a\n", "image"),
+    (b"\xff\xd8\xff", "image"),
+    (b"GIF87a", "image"),
+    (b"GIF89a", "image"),
+    (b"BM", "image"),
+    (b"II*\x00", "image"),
+    (b"MM\x00*", "image"),
+    (b"\x00\x00\x01\x00", "image"),  # ICO
+    (b"\x1aE\xdf\xa3", "video"),  # Matroska / WebM
+    (b"\x00\x00\x01\xba", "video"),  # MPEG-PS
+    (b"\x00\x00\x01\xb3", "video"),  # MPEG-1/2 ES
+)
+_RIFF_FORMS = {b"WEBP": "image", b"AVI ": "video"}
+_FTYP_IMAGE_BRANDS = frozenset({b"avif", b"avis", b"heic", b"heix", b"mif1", b"msf1"})
+_TS_PACKET = 188
+
+
+def _magic_media_type(head: bytes) -> Optional[str]:
+    """Тип по сигнатуре первых байтов файла; None, если сигнатура незнакома."""
+    # ftyp проверяется первым: первые 4 байта там — размер бокса и могут
+    # случайно совпасть с короткой сигнатурой вроде ICO.
+    if head[4:8] == b"ftyp":
+        return "image" if head[8:12] in _FTYP_IMAGE_BRANDS else "video"
+    for prefix, media_type in _PREFIX_MAGICS:
+        if head.startswith(prefix):
+            return media_type
+    if head[:4] == b"RIFF":
+        return _RIFF_FORMS.get(head[8:12])
+    if len(head) > _TS_PACKET and head[0] == 0x47 and head[_TS_PACKET] == 0x47:
+        return "video"  # MPEG-TS: sync byte каждые 188 байт
+    return None
+
+
+# Тип по URL не меняется в пределах запуска; ключ — полный URL, потому что у
+# presigned-ссылок разные объекты отличаются именно query-параметрами.
+SNIFF_CACHE_TTL = 3600.0
+SNIFF_CACHE_MAX = 1024
+_SNIFF_CACHE: Dict[str, Tuple[float, str]] = {}
+_SNIFF_CACHE_LOCK = threading.Lock()
+
+
 def sniff_remote_media_type(
     url: str,
     *,
@@ -109,8 +434,26 @@ def sniff_remote_media_type(
     if extension in VIDEO_EXTENSIONS:
         return "video"
 
+    now = time.monotonic()
+    with _SNIFF_CACHE_LOCK:
+        cached = _SNIFF_CACHE.get(url)
+    if cached is not None and now - cached[0] < SNIFF_CACHE_TTL:
+        return cached[1]
+
+    media_type = _sniff_over_network(url)
+    if media_type is None:
+        # Сетевой сбой не кешируем: следующий вызов попробует ещё раз.
+        return "video"
+    with _SNIFF_CACHE_LOCK:
+        if url not in _SNIFF_CACHE and len(_SNIFF_CACHE) >= SNIFF_CACHE_MAX:
+            _SNIFF_CACHE.pop(next(iter(_SNIFF_CACHE)))
+        _SNIFF_CACHE[url] = (now, media_type)
+    return media_type
+
+
+def _sniff_over_network(url: str) -> Optional[str]:
     try:
-        response = requests.head(url, allow_redirects=True, timeout=10)
+        response = _http_session().head(url, allow_redirects=True, timeout=10)
         response.raise_for_status()
         media_type = _content_type_to_media_type(response.headers.get("Content-Type"))
         if media_type:
@@ -119,33 +462,31 @@ def sniff_remote_media_type(
         pass
 
     try:
-        with requests.get(url, stream=True, timeout=10) as resp:
+        with _http_session().get(
+            url,
+            headers={"Range": f"bytes=0-{SNIFF_BYTES - 1}"},
+            stream=True,
+            timeout=10,
+        ) as resp:
             resp.raise_for_status()
-            data = bytearray()
-            for chunk in resp.iter_content(chunk_size=8192):
-                data.extend(chunk)
-                if len(data) >= 131072:
-                    break
-            if not data:
-                return "video"
-        try:
-            Image.open(io.BytesIO(data))
-            return "image"
-        except Exception:
-            return "video"
+            # Сервер без поддержки Range ответит 200 с полным телом — читаем только начало.
+            data = resp.raw.read(SNIFF_BYTES, decode_content=True) or b""
     except requests.RequestException:
-        return "video"
+        return None
+    if not data:
+        return None
 
-    return "video"
+    # Незнакомая сигнатура трактуется как видео — так же, как раньше при отказе PIL.
+    return _magic_media_type(data) or "video"
 
 
-TARGET_ASPECT = 9 / 16
+TARGET_ASPECT_W, TARGET_ASPECT_H = 9, 16
+TARGET_ASPECT = TARGET_ASPECT_W / TARGET_ASPECT_H
 
 
 def decide_fit(width: int, height: int, tolerance: float) -> str:
     if width <= 0 or height <= 0:
         return "cover"
-    aspect = width / height
-    if abs(aspect - TARGET_ASPECT) <= tolerance:
-        return "cover"
-    return "contain"
+    # |w/h - 9/16| <= tol  <=>  |16w - 9h| <= tol * 16h: левая часть точная, без деления.
+    deviation = abs(width * TARGET_ASPECT_H - height * TARGET_ASPECT_W)
+    return "cover" if deviation <= tolerance * height * TARGET_ASPECT_H else "contain"
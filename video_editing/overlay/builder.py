@@ -4,7 +4,11 @@ import tempfile
 from pathlib import Path
 from typing import Dict, Iterable, Type
 
-import prepare_overlay
+from common.http import parallel_download
+
+# prepare_overlay тянет cv2/mediapipe/rembg, поэтому импортируется лениво внутри
+# generate_overlay_urls: --help, --no-render и Modal-путь не платят за холодный
+# импорт. Скачивание идёт через лёгкий common.http.
 
 
 def generate_overlay_urls(
@@ -24,44 +28,44 @@ def generate_overlay_urls(
     error_cls: Type[Exception] = RuntimeError,
     auto_circle_center: bool = True,
 ) -> Dict[str, str]:
-    urls: Dict[str, str] = {}
     shapes = set(shapes)
     if not shapes:
-        return urls
+        return {}
+
+    import prepare_overlay
 
-    with tempfile.TemporaryDirectory() as tmpdir_str:
+    with tempfile.TemporaryDirectory(dir=prepare_overlay.scratch_dir()) as tmpdir_str:
         tmpdir = Path(tmpdir_str)
-        for shape in shapes:
-            output_name = f"overlay_{shape}.{'mov' if container == 'mov' else 'webm'}"
-            output_path = tmpdir / output_name
-            step_ctx = timed_step if timed_step is not None else _nullcontext
-            with step_ctx(f"Подготовка оверлея {shape}"):
-                try:
-                    overlay_url = prepare_overlay.prepare_overlay(
-                        head_url,
-                        output_path,
-                        stage,
-                        api_key,
-                        container,
-                        threshold=0.6,
-                        feather=7,
-                        debug=False,
-                        engine=engine,
-                        rembg_model=rembg_model,
-                        rembg_alpha_matting=rembg_alpha_matting,
-                        rembg_fg_threshold=240,
-                        rembg_bg_threshold=10,
-                        rembg_erode_size=10,
-                        rembg_base_size=1000,
-                        shape=shape,
-                        circle_radius=circle_radius,
-                        circle_center_x=circle_center_x,
-                        circle_center_y=circle_center_y,
-                        circle_auto_center=auto_circle_center,
-                    )
-                except Exception as exc:
-                    raise error_cls(f"Не удалось подготовить оверлей формы '{shape}': {exc}") from exc
-            urls[shape] = overlay_url
+        extension = "mov" if container == "mov" else "webm"
+        output_paths = {shape: tmpdir / f"overlay_{shape}.{extension}" for shape in sorted(shapes)}
+        shape_list = ", ".join(output_paths)
+        step_ctx = timed_step if timed_step is not None else _nullcontext
+        # Все формы строятся из одного прохода сегментации по исходнику.
+        with step_ctx(f"Подготовка оверлеев {shape_list}"):
+            try:
+                urls = prepare_overlay.prepare_overlays(
+                    head_url,
+                    output_paths,
+                    stage,
+                    api_key,
+                    container,
+                    threshold=0.6,
+                    feather=7,
+                    debug=False,
+                    engine=engine,
+                    rembg_model=rembg_model,
+                    rembg_alpha_matting=rembg_alpha_matting,
+                    rembg_fg_threshold=240,
+                    rembg_bg_threshold=10,
+                    rembg_erode_size=10,
+                    rembg_base_size=1000,
+                    circle_radius=circle_radius,
+                    circle_center_x=circle_center_x,
+                    circle_center_y=circle_center_y,
+                    circle_auto_center=auto_circle_center,
+                )
+            except Exception as exc:
+                raise error_cls(f"Не удалось подготовить оверлеи форм '{shape_list}': {exc}") from exc
     return urls
 
 
@@ -79,6 +83,6 @@ class _nullcontext:
 def download_to_temp(url: str, dest: Path, *, error_cls: Type[Exception] = RuntimeError) -> None:
     print(f"Скачиваем {url}...")
     try:
-        prepare_overlay.download_file(url, dest)
+        parallel_download(url, dest)
     except Exception as exc:
         raise error_cls(f"Не удалось скачать файл: {url}") from exc
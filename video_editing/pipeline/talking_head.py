@@ -3,21 +3,29 @@ Core logic for the talking-head automation pipeline.
 """
 from __future__ import annotations
 
-import copy
 import os
 import tempfile
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
 
-from common.media import MediaMeta, decide_fit, run_ffprobe_meta, sniff_remote_media_type
-from overlay import download_to_temp, generate_overlay_urls
-from render.shotstack import DEFAULT_STAGE, ShotstackError, render_from_spec
+from common import jsonio
+from render.shotstack import DEFAULT_STAGE, ShotstackError, render_from_specs_batch
 from render.subtitle import subtitle_tools
-from render.templates import ensure_background, get_node, load_spec, save_spec, update_nodes
+from render.templates import ensure_background, get_node, load_spec, save_spec, update_clip, update_nodes
 from render.timeline import apply_blocks, load_blocks_config
 
+# common.media (requests, Pillow, PyAV) и overlay импортируются внутри методов:
+# --help и validate_templates их не используют.
+if TYPE_CHECKING:
+    from common.media import MediaMeta
+
 DEFAULT_FIT_TOLERANCE = 0.02
 BUILD_ROOT = Path("build")
 
@@ -26,14 +34,21 @@ class PipelineError(RuntimeError):
     """Raised for any automation failure."""
 
 
+# TH_PIPELINE_QUIET=1 глушит вывод шагов (бенчмарки).
+QUIET_STEPS = os.getenv("TH_PIPELINE_QUIET") == "1"
+
+
 @contextmanager
 def timed_step(description: str) -> Iterator[None]:
-    print(f"--> {description}")
-    start = time.perf_counter()
+    if QUIET_STEPS:
+        yield
+        return
+    print("--> " + description)
+    start_ns = time.monotonic_ns()
     try:
         yield
     finally:
-        elapsed = time.perf_counter() - start
+        elapsed = (time.monotonic_ns() - start_ns) / 1e9
         print(f"<-- {description}: {elapsed:.2f}s")
 
 
@@ -67,6 +82,43 @@ TEMPLATE_REGISTRY: Dict[str, Dict[str, object]] = {
     },
 }
 
+NodePath = Tuple[object, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class TemplateConfig:
+    """Скомпилированная запись TEMPLATE_REGISTRY: готовый Path и кортежи путей к узлам."""
+
+    file: Path
+    head_nodes: Tuple[NodePath, ...] = ()
+    background_nodes: Tuple[NodePath, ...] = ()
+    overlay_nodes: Mapping[str, Tuple[NodePath, ...]] = field(default_factory=dict)
+
+
+def _compile_template_config(raw: Dict[str, object]) -> TemplateConfig:
+    def paths(key: str) -> Tuple[NodePath, ...]:
+        return tuple(tuple(path) for path in raw.get(key, ()))  # type: ignore[union-attr]
+
+    overlay_nodes = raw.get("overlay_nodes") or {}
+    return TemplateConfig(
+        file=Path(raw["file"]),  # type: ignore[arg-type]
+        head_nodes=paths("head_nodes"),
+        background_nodes=paths("background_nodes"),
+        overlay_nodes={
+            shape: tuple(tuple(path) for path in shape_paths)
+            for shape, shape_paths in overlay_nodes.items()  # type: ignore[union-attr]
+        },
+    )
+
+
+TEMPLATE_CONFIGS: Dict[str, TemplateConfig] = {
+    name: _compile_template_config(raw) for name, raw in TEMPLATE_REGISTRY.items()
+}
+TEMPLATE_NAMES = frozenset(TEMPLATE_CONFIGS)
+TEMPLATE_SHAPES: Dict[str, frozenset[str]] = {
+    name: frozenset(config.overlay_nodes) for name, config in TEMPLATE_CONFIGS.items()
+}
+
 MIX_TEMPLATES = {"mix_basic_overlay", "mix_basic_circle"}
 MIX_DEFAULT_LEAD_IN = 3.0
 MIX_LEAD_DISABLE_TOLERANCE = 0.5
@@ -77,20 +129,26 @@ BACKGROUND_MAX_SPEED = 1.2
 BACKGROUND_TAIL_THRESHOLD = 15.0
 
 
+@lru_cache(maxsize=64)
+def _split_template_names(raw: str) -> Tuple[str, ...]:
+    # CLI-строки шаблонов повторяются между запусками batch-драйвера — разбираем один раз.
+    return tuple(name for name in (item.strip() for item in raw.split(",")) if name)
+
+
 def parse_template_list(raw: Optional[str], default: Sequence[str]) -> List[str]:
     if raw is None:
         return list(default)
-    items = [item.strip() for item in raw.split(",") if item.strip()]
-    return items or list(default)
+    items = _split_template_names(raw)
+    return list(items) if items else list(default)
 
 
 def validate_templates(names: Iterable[str]) -> List[str]:
     valid: List[str] = []
-    for name in names:
-        name = name.strip()
+    for raw_name in names:
+        name = raw_name.strip()
         if not name:
             continue
-        if name not in TEMPLATE_REGISTRY:
+        if name not in TEMPLATE_NAMES:
             raise PipelineError(f"Неизвестный шаблон: {name}")
         valid.append(name)
     if not valid:
@@ -104,22 +162,66 @@ def build_output_dir(explicit: Optional[str]) -> Path:
         path.mkdir(parents=True, exist_ok=True)
         return path
     timestamp = time.strftime("%Y%m%d_%H%M%S")
-    path = BUILD_ROOT / f"auto_{timestamp}"
-    path.mkdir(parents=True, exist_ok=True)
+    # Суффикс исключает общий каталог у двух запусков в одну и ту же секунду.
+    path = BUILD_ROOT / f"auto_{timestamp}_{uuid.uuid4().hex[:6]}"
+    path.mkdir(parents=True, exist_ok=False)
     return path
 
 
 def render_specs(spec_paths: Iterable[Path]) -> Dict[str, Dict[str, object]]:
-    results: Dict[str, Dict[str, object]] = {}
-    for spec_path in spec_paths:
-        with timed_step(f"Рендер {spec_path.name}"):
-            result = render_from_spec(str(spec_path))
-        results[spec_path.name] = result
-        print(f"Готово: {result.get('url')}")
-    return results
+    spec_paths = list(spec_paths)
+    if not spec_paths:
+        return {}
+    # Все задания сначала отправляются в Shotstack одной пачкой, затем статусы
+    # опрашиваются параллельно — результаты печатаются по мере готовности.
+    by_path = {str(spec_path): spec_path for spec_path in spec_paths}
+    completed: Dict[str, Dict[str, object]] = {}
+    for path_str, result in render_from_specs_batch(list(by_path)):
+        completed[by_path[path_str].name] = result
+        print(f"Готово ({by_path[path_str].name}): {result.get('url')}")
+    return {spec_path.name: completed[spec_path.name] for spec_path in spec_paths}
+
+
+def _freeze(value: Any) -> bytes:
+    """
+    Сериализовать JSON-совместимое значение в bytes, чтобы клонировать его через loads.
+    Декодирование JSON заметно дешевле copy.deepcopy для вложенных dict/list.
+    """
+    return jsonio.dumps(value)
+
+
+def _thaw(blob: bytes) -> Any:
+    return jsonio.loads(blob)
+
+
+@lru_cache(maxsize=4)
+def _parsed_blob(blob: bytes) -> Tuple[Any, ...]:
+    """Разобрать blob один раз на процесс; результат общий и только для чтения."""
+    return tuple(_thaw(blob))
+
+
+def _subtitle_track(entries: Iterable[Any]) -> List[Any]:
+    # Записи из кеша _parsed_blob общие для всех шаблонов, поэтому в spec
+    # всегда идут копии. apply_blocks и последующая обработка правят только
+    # верхнеуровневые поля записи — поверхностной копии dict достаточно.
+    return [dict(entry) if isinstance(entry, dict) else entry for entry in entries]
+
+
+@lru_cache(maxsize=32)
+def _template_blob(path_str: str, mtime_ns: int) -> bytes:
+    # mtime_ns в ключе: отредактированный пресет перечитывается без перезапуска процесса.
+    return _freeze(load_spec(Path(path_str)))
+
+
+def _load_template_spec(file_path: Path) -> Dict[str, Any]:
+    """Свежая изменяемая копия пресета; файл читается и разбирается один раз на версию."""
+    return _thaw(_template_blob(str(file_path), file_path.stat().st_mtime_ns))
 
 
 def _safe_float(value: object) -> float:
+    # Числа — частый случай в спеках: приводим без try/except, строки и мусор — через исключение.
+    if isinstance(value, (int, float)):
+        return float(value)
     try:
         return float(value or 0.0)
     except (TypeError, ValueError):
@@ -131,16 +233,12 @@ def _estimate_clip_end(clip: Dict[str, Any], fallback_duration: float) -> float:
     Approximate момент окончания клипа: старт + (length | длительность из метаданных - trim).
     Используется до shotstack-автоматизации, когда length может быть не заполнен.
     """
-    start = _safe_float(clip.get("start", 0.0))
+    start = _safe_float(clip.get("start"))
     length = clip.get("length")
     if isinstance(length, (int, float)):
-        try:
-            duration = max(float(length), 0.0)
-        except (TypeError, ValueError):
-            duration = 0.0
-        return start + duration
+        return start + max(float(length), 0.0)
 
-    trim = _safe_float(clip.get("trim", 0.0))
+    trim = _safe_float(clip.get("trim"))
     effective_fallback = max(fallback_duration - trim, 0.0)
     return start + effective_fallback
 
@@ -150,26 +248,20 @@ def _track_end(entries: Iterable[Dict[str, Any]], target_end: float) -> float:
     for entry in entries:
         if not isinstance(entry, dict):
             continue
-        try:
-            start = float(entry.get("start", 0.0) or 0.0)
-        except (TypeError, ValueError):
-            start = 0.0
+        get = entry.get
+        start = _safe_float(get("start"))
 
-        length_value = entry.get("length")
-        duration: float
+        length_value = get("length")
         if isinstance(length_value, (int, float)):
-            try:
-                duration = max(float(length_value), 0.0)
-            except (TypeError, ValueError):
-                duration = 0.0
-            end_candidate = start + duration
-        elif entry.get("auto_length") or entry.get("match_length_to"):
+            end_candidate = start + max(float(length_value), 0.0)
+        elif get("auto_length") or get("match_length_to"):
             end_candidate = max(target_end, start)
         else:
             fallback_duration = max(target_end - start, 0.0)
             end_candidate = _estimate_clip_end(entry, fallback_duration)
 
-        end = max(end, end_candidate)
+        if end_candidate > end:
+            end = end_candidate
     return end
 
 
@@ -178,16 +270,11 @@ def _subtitles_end(subtitles: Iterable[Dict[str, Any]]) -> float:
     for subtitle in subtitles:
         if not isinstance(subtitle, dict):
             continue
-        try:
-            start = float(subtitle.get("start", 0.0) or 0.0)
-        except (TypeError, ValueError):
-            start = 0.0
         length = subtitle.get("length")
-        try:
-            duration = max(float(length), 0.0) if isinstance(length, (int, float)) else 0.0
-        except (TypeError, ValueError):
-            duration = 0.0
-        end = max(end, start + duration)
+        duration = max(float(length), 0.0) if isinstance(length, (int, float)) else 0.0
+        candidate = _safe_float(subtitle.get("start")) + duration
+        if candidate > end:
+            end = candidate
     return end
 
 
@@ -197,10 +284,7 @@ def _lock_auto_length(entries: Iterable[Dict[str, Any]], target_end: float) -> N
             continue
         if not entry.get("auto_length") and not entry.get("match_length_to"):
             continue
-        try:
-            start = float(entry.get("start", 0.0) or 0.0)
-        except (TypeError, ValueError):
-            start = 0.0
+        start = _safe_float(entry.get("start"))
         desired_length = max(target_end - start, 0.0)
         entry["length"] = round(max(desired_length, 0.001), 3)
         entry.pop("auto_length", None)
@@ -208,6 +292,65 @@ def _lock_auto_length(entries: Iterable[Dict[str, Any]], target_end: float) -> N
         entry.pop("speed", None)
 
 
+@dataclass(frozen=True, slots=True)
+class PipelineSettings:
+    """Значения CLI-аргументов, нужные после __init__, с уже подставленными дефолтами."""
+
+    head_url: str
+    background_url: str
+    fit_tolerance: float
+    force_download_background: bool
+    background_video_mode: str
+    background_color: str
+    subtitles: Optional[str]
+    subtitles_enabled: str
+    subtitle_theme: str
+    intro_url: Optional[str]
+    intro_templates: Optional[str]
+    intro_length: float
+    outro_url: Optional[str]
+    outro_templates: Optional[str]
+    outro_length: float
+    overlay_container: str
+    overlay_engine: str
+    rembg_model: str
+    rembg_alpha_matting: bool
+    circle_radius: float
+    circle_center_x: float
+    circle_center_y: float
+    circle_auto_center: bool
+    no_render: bool
+
+    @classmethod
+    def from_args(cls, args) -> "PipelineSettings":
+        return cls(
+            head_url=args.head_url,
+            background_url=args.background_url,
+            fit_tolerance=args.fit_tolerance,
+            force_download_background=getattr(args, "force_download_background", False),
+            background_video_mode=getattr(args, "background_video_length", "auto"),
+            background_color=args.background_color,
+            subtitles=args.subtitles,
+            subtitles_enabled=args.subtitles_enabled,
+            subtitle_theme=args.subtitle_theme,
+            intro_url=args.intro_url,
+            intro_templates=args.intro_templates,
+            intro_length=args.intro_length,
+            outro_url=args.outro_url,
+            outro_templates=args.outro_templates,
+            outro_length=args.outro_length,
+            overlay_container=args.overlay_container,
+            overlay_engine=args.overlay_engine,
+            rembg_model=args.rembg_model,
+            rembg_alpha_matting=args.rembg_alpha_matting,
+            circle_radius=args.circle_radius,
+            circle_center_x=args.circle_center_x,
+            circle_center_y=args.circle_center_y,
+            circle_auto_center=getattr(args, "circle_auto_center", True),
+            no_render=args.no_render,
+        )
+
+
 class TalkingHeadPipeline:
     def __init__(
         self,
@@ -215,7 +358,7 @@ class TalkingHeadPipeline:
         *,
         overlay_provider: Optional[Callable[[Iterable[str]], Dict[str, str]]] = None,
     ) -> None:
-        self.args = args
+        self.settings = PipelineSettings.from_args(args)
         self.templates = validate_templates(args.templates.split(","))
         self.api_key = os.getenv("SHOTSTACK_API_KEY")
         if not self.api_key:
@@ -228,20 +371,12 @@ class TalkingHeadPipeline:
             args.transcript_file,
             error_cls=PipelineError,
         )
-        self.circle_auto_center = getattr(args, "circle_auto_center", True)
-        self.background_video_mode = getattr(args, "background_video_length", "auto")
         self.output_dir = build_output_dir(args.output_dir)
         print(f"Спецификации будут сохранены в {self.output_dir}")
         self.overlay_provider = overlay_provider
 
-    def _collect_required_shapes(self) -> set[str]:
-        shapes: set[str] = set()
-        for template in self.templates:
-            config = TEMPLATE_REGISTRY[template]
-            overlay_nodes = config.get("overlay_nodes", {})
-            if isinstance(overlay_nodes, dict):
-                shapes.update(overlay_nodes.keys())
-        return shapes
+    def _collect_required_shapes(self) -> frozenset[str]:
+        return frozenset().union(*(TEMPLATE_SHAPES[template] for template in self.templates))
 
     def _determine_mix_lead_in(
         self,
@@ -336,7 +471,7 @@ class TalkingHeadPipeline:
     ) -> None:
         if (
             not background_entries
-            or self.background_video_mode != "auto"
+            or self.settings.background_video_mode != "auto"
             or background_meta.asset_type != "video"
         ):
             return
@@ -393,107 +528,162 @@ class TalkingHeadPipeline:
             clip["length"] = round(max(clip_length, MIN_CLIP_LENGTH), 3)
 
     def _generate_overlay_urls(self) -> Dict[str, str]:
+        from overlay import generate_overlay_urls
+
         with timed_step("Генерация оверлеев"):
             return generate_overlay_urls(
-                head_url=self.args.head_url,
+                head_url=self.settings.head_url,
                 shapes=self.required_shapes,
                 stage=self.stage,
                 api_key=self.api_key,
-                container=self.args.overlay_container,
-                engine=self.args.overlay_engine,
-                rembg_model=self.args.rembg_model,
-                rembg_alpha_matting=self.args.rembg_alpha_matting,
-                circle_radius=self.args.circle_radius,
-                circle_center_x=self.args.circle_center_x,
-                circle_center_y=self.args.circle_center_y,
+                container=self.settings.overlay_container,
+                engine=self.settings.overlay_engine,
+                rembg_model=self.settings.rembg_model,
+                rembg_alpha_matting=self.settings.rembg_alpha_matting,
+                circle_radius=self.settings.circle_radius,
+                circle_center_x=self.settings.circle_center_x,
+                circle_center_y=self.settings.circle_center_y,
                 timed_step=timed_step,
                 error_cls=PipelineError,
-                auto_circle_center=self.circle_auto_center,
+                auto_circle_center=self.settings.circle_auto_center,
             )
 
     def _load_manual_subtitles(self) -> Optional[List[Dict[str, object]]]:
-        if not self.args.subtitles:
+        if not self.settings.subtitles:
             return None
-        subtitles = subtitle_tools.load_subtitles(self.args.subtitles, error_cls=PipelineError)
+        subtitles = subtitle_tools.load_subtitles(self.settings.subtitles, error_cls=PipelineError)
         print(f"Загружено субтитров: {len(subtitles)}")
         return subtitles
 
+    def _probe_source(self, url: str, dest: Path, label: str, *, download: bool) -> MediaMeta:
+        """
+        Получить метаданные источника. По умолчанию ffprobe читает URL напрямую,
+        скачивание нужно только когда дальше требуются локальные байты или
+        удалённый probe не сработал.
+        """
+        from common.media import run_ffprobe_meta, run_ffprobe_meta_url
+        from overlay import download_to_temp
+
+        if not download:
+            try:
+                with timed_step(f"Анализ {label} по URL (ffprobe)"):
+                    return run_ffprobe_meta_url(url, error_cls=PipelineError)
+            except PipelineError as exc:
+                print(f"Не удалось проанализировать {label} по URL ({exc}), скачиваем файл.")
+        with timed_step(f"Скачивание {label}"):
+            download_to_temp(url, dest, error_cls=PipelineError)
+        with timed_step(f"Анализ {label} (ffprobe)"):
+            return run_ffprobe_meta(dest, error_cls=PipelineError)
+
+    def _analyze_head_speech(self, head_path: Path) -> Tuple[float, List[Dict[str, object]]]:
+        """
+        Скачать голову и за один проход ffmpeg получить длительность, наличие
+        видеопотока и паузы для авто-субтитров — отдельный ffprobe не нужен.
+        """
+        from common.media import run_ffprobe_meta
+        from overlay import download_to_temp
+
+        with timed_step("Скачивание говорящей головы"):
+            download_to_temp(self.settings.head_url, head_path, error_cls=PipelineError)
+        with timed_step("Анализ речи и авто-субтитры"):
+            analysis = subtitle_tools.analyze_speech(head_path, error_cls=PipelineError)
+            if not analysis.has_video:
+                raise PipelineError("Говорящая голова должна быть видео.")
+            head_duration = analysis.duration
+            if head_duration is None:
+                head_meta = run_ffprobe_meta(head_path, error_cls=PipelineError)
+                if head_meta.asset_type != "video":
+                    raise PipelineError("Говорящая голова должна быть видео.")
+                head_duration = head_meta.duration
+            segments = subtitle_tools.build_speech_segments(analysis.silences, head_duration)
+            auto_subtitles = subtitle_tools.align_transcript_to_segments(
+                self.transcript_text or "",
+                segments,
+                head_duration,
+            )
+        print(f"Автоматически создано субтитров: {len(auto_subtitles)}")
+        return head_duration, auto_subtitles
+
+    def _prepare_head(self, head_path: Path) -> Tuple[float, Optional[List[Dict[str, object]]]]:
+        if self.transcript_text:
+            return self._analyze_head_speech(head_path)
+        head_meta = self._probe_source(self.settings.head_url, head_path, "говорящей головы", download=False)
+        if head_meta.asset_type != "video":
+            raise PipelineError("Говорящая голова должна быть видео.")
+        return head_meta.duration, None
+
     def _prepare_media(self) -> Tuple[MediaMeta, float, str, Optional[List[Dict[str, object]]]]:
-        auto_subtitles: Optional[List[Dict[str, object]]] = None
+        from common.media import decide_fit
+
         with tempfile.TemporaryDirectory() as tmpdir_str:
             tmpdir = Path(tmpdir_str)
-            bg_path = tmpdir / "background_source"
-            with timed_step("Скачивание фона"):
-                download_to_temp(self.args.background_url, bg_path, error_cls=PipelineError)
-            with timed_step("Анализ фона (ffprobe)"):
-                background_meta = run_ffprobe_meta(bg_path, error_cls=PipelineError)
-
-            fit_mode = decide_fit(background_meta.width, background_meta.height, self.args.fit_tolerance)
-            aspect_ratio = background_meta.width / background_meta.height if background_meta.height else 0.0
-            if background_meta.asset_type == "image":
-                print(
-                    f"Аспект фона {background_meta.width}x{background_meta.height} ({aspect_ratio:.3f}), "
-                    f"статичное изображение. Выбран fit={fit_mode}."
-                )
-            else:
-                print(
-                    f"Аспект фона {background_meta.width}x{background_meta.height} ({aspect_ratio:.3f}), "
-                    f"длительность {background_meta.duration:.2f}s. Выбран fit={fit_mode}."
+            # Фон и голова независимы и упираются в сеть/ffmpeg — качаем и анализируем параллельно.
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                background_future = executor.submit(
+                    self._probe_source,
+                    self.settings.background_url,
+                    tmpdir / "background_source",
+                    "фона",
+                    download=self.settings.force_download_background,
                 )
-            if fit_mode == "contain":
-                print("Используем подложку и fit=contain, искажений не будет.")
+                head_future = executor.submit(self._prepare_head, tmpdir / "head_source")
+                background_meta = background_future.result()
+                head_duration, auto_subtitles = head_future.result()
 
-            head_path = tmpdir / "head_source"
-            with timed_step("Скачивание говорящей головы"):
-                download_to_temp(self.args.head_url, head_path, error_cls=PipelineError)
-            with timed_step("Анализ говорящей головы (ffprobe)"):
-                head_meta = run_ffprobe_meta(head_path, error_cls=PipelineError)
-            if head_meta.asset_type != "video":
-                raise PipelineError("Говорящая голова должна быть видео.")
+        fit_mode = decide_fit(background_meta.width, background_meta.height, self.settings.fit_tolerance)
+        aspect_ratio = background_meta.width / background_meta.height if background_meta.height else 0.0
+        if background_meta.asset_type == "image":
+            print(
+                f"Аспект фона {background_meta.width}x{background_meta.height} ({aspect_ratio:.3f}), "
+                f"статичное изображение. Выбран fit={fit_mode}."
+            )
+        else:
+            print(
+                f"Аспект фона {background_meta.width}x{background_meta.height} ({aspect_ratio:.3f}), "
+                f"длительность {background_meta.duration:.2f}s. Выбран fit={fit_mode}."
+            )
+        if fit_mode == "contain":
+            print("Используем подложку и fit=contain, искажений не будет.")
 
-            if self.transcript_text:
-                with timed_step("Анализ речи и авто-субтитры"):
-                    segments = subtitle_tools.detect_speech_segments(
-                        head_path,
-                        head_meta.duration,
-                        error_cls=PipelineError,
-                    )
-                    auto_subtitles = subtitle_tools.align_transcript_to_segments(
-                        self.transcript_text,
-                        segments,
-                        head_meta.duration,
-                    )
-                print(f"Автоматически создано субтитров: {len(auto_subtitles)}")
-
-        return background_meta, head_meta.duration, fit_mode, auto_subtitles
+        return background_meta, head_duration, fit_mode, auto_subtitles
 
     def _prepare_cli_blocks(self) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]], Dict[str, float]]:
+        from common.media import sniff_remote_media_type
+
         intro_settings: Optional[Dict[str, Any]] = None
         outro_settings: Optional[Dict[str, Any]] = None
 
-        if self.args.intro_url:
-            templates_for_intro = set(parse_template_list(self.args.intro_templates, self.templates))
-            intro_type = sniff_remote_media_type(self.args.intro_url, error_cls=PipelineError)
+        if self.settings.intro_url:
+            templates_for_intro = frozenset(parse_template_list(self.settings.intro_templates, self.templates))
+            intro_type = sniff_remote_media_type(self.settings.intro_url, error_cls=PipelineError)
             intro_clip: Dict[str, Any] = {
                 "type": intro_type,
-                "src": self.args.intro_url,
-                "length": max(self.args.intro_length, 0.1),
+                "src": self.settings.intro_url,
+                "length": max(self.settings.intro_length, 0.1),
                 "fit": "contain",
                 "transition": "fade",
             }
-            intro_settings = {"clip": intro_clip, "templates": templates_for_intro}
+            intro_settings = {
+                "clip": intro_clip,
+                "clip_blob": _freeze(intro_clip),
+                "templates": templates_for_intro,
+            }
 
-        if self.args.outro_url:
-            templates_for_outro = set(parse_template_list(self.args.outro_templates, self.templates))
-            outro_type = sniff_remote_media_type(self.args.outro_url, error_cls=PipelineError)
+        if self.settings.outro_url:
+            templates_for_outro = frozenset(parse_template_list(self.settings.outro_templates, self.templates))
+            outro_type = sniff_remote_media_type(self.settings.outro_url, error_cls=PipelineError)
             outro_clip: Dict[str, Any] = {
                 "type": outro_type,
-                "src": self.args.outro_url,
-                "length": max(self.args.outro_length, 0.1),
+                "src": self.settings.outro_url,
+                "length": max(self.settings.outro_length, 0.1),
                 "fit": "contain",
                 "transition": "fade",
             }
-            outro_settings = {"clip": outro_clip, "templates": templates_for_outro}
+            outro_settings = {
+                "clip": outro_clip,
+                "clip_blob": _freeze(outro_clip),
+                "templates": templates_for_outro,
+            }
 
         intro_lengths_by_template: Dict[str, float] = {}
         if intro_settings:
@@ -511,10 +701,10 @@ class TalkingHeadPipeline:
     ) -> Dict[str, Any]:
         cli_blocks: Dict[str, Any] = {}
         if intro_settings and template in intro_settings["templates"]:
-            clip = copy.deepcopy(intro_settings["clip"])
+            clip = _thaw(intro_settings["clip_blob"])
             cli_blocks.setdefault("prepend_clips", []).append(clip)
         if outro_settings and template in outro_settings["templates"]:
-            clip = copy.deepcopy(outro_settings["clip"])
+            clip = _thaw(outro_settings["clip_blob"])
             cli_blocks.setdefault("append_clips", []).append(clip)
         return cli_blocks
 
@@ -525,85 +715,72 @@ class TalkingHeadPipeline:
         head_duration: float,
         fit_mode: str,
         overlay_urls: Dict[str, str],
-        subtitles_from_file: Optional[List[Dict[str, object]]],
+        subtitles_blob: Optional[bytes],
         auto_subtitles: Optional[List[Dict[str, object]]],
         intro_settings: Optional[Dict[str, Any]],
         outro_settings: Optional[Dict[str, Any]],
         intro_lengths_by_template: Dict[str, float],
     ) -> Path:
-        config = TEMPLATE_REGISTRY[template]
-        file_path = Path(config["file"])  # type: ignore[index]
+        config = TEMPLATE_CONFIGS[template]
+        file_path = config.file
         if not file_path.exists():
             raise PipelineError(f"Не найден файл шаблона: {file_path}")
 
-        spec = load_spec(file_path)
+        spec = _load_template_spec(file_path)
         max_content_end = 0.0
 
-        head_entries: List[Dict[str, Any]] = []
+        # Узлы находятся один раз: дальше работаем со ссылками на сами dict-клипы.
+        # Индексы дорожек могут сдвинуться после prepend-блоков, ссылки — нет.
+        head_entries = [get_node(spec, path, error_cls=PipelineError) for path in config.head_nodes]
         mix_lead_in: Optional[float] = None
-        if config.get("head_nodes"):
-            update_nodes(
-                spec,
-                config["head_nodes"],
-                self.args.head_url,
-                None,
-                error_cls=PipelineError,
-            )  # type: ignore[arg-type]
-            for path in config["head_nodes"]:
-                clip = get_node(spec, path, error_cls=PipelineError)
-                head_entries.append(clip)
-            if head_entries:
-                head_max_end = _track_end(head_entries, head_duration)
-                if head_max_end > 0.0:
-                    max_content_end = max(max_content_end, head_max_end)
-                mix_lead_in = self._determine_mix_lead_in(template, head_duration, background_meta)
-                if mix_lead_in is not None:
-                    self._apply_mix_lead_in_to_head_entries(head_entries, mix_lead_in, head_duration)
-
-        background_entries: List[Dict[str, Any]] = []
-        if config.get("background_nodes"):
-            update_nodes(
-                spec,
-                config["background_nodes"],
-                self.args.background_url,
-                fit_mode,
-                error_cls=PipelineError,
-                asset_type=background_meta.asset_type,
-            )  # type: ignore[arg-type]
-            for path in config["background_nodes"]:
-                clip = get_node(spec, path, error_cls=PipelineError)
-                background_entries.append(clip)
-            if background_entries:
-                if mix_lead_in is not None:
-                    self._apply_mix_lead_in_to_background_entries(background_entries, mix_lead_in)
-                if background_meta.asset_type == "video" and self.background_video_mode == "fixed":
-                    for clip in background_entries:
-                        clip.pop("match_length_to", None)
-                        clip.pop("auto_length", None)
-                        clip.pop("speed", None)
-                        length_value = max(background_meta.duration - _safe_float(clip.get("trim", 0.0)), 0.0)
-                        clip["length"] = round(max(length_value, 0.1), 3)
-                elif background_meta.asset_type == "video":
-                    self._retime_background_entries(background_entries, head_duration, background_meta)
-                target_end = max_content_end if max_content_end > 0.0 else head_duration
-                if background_meta.asset_type == "video" and self.background_video_mode == "fixed":
-                    target_end = max(
-                        target_end,
-                        max(
-                            _safe_float(clip.get("start", 0.0)) + max(
-                                background_meta.duration - _safe_float(clip.get("trim", 0.0)),
-                                0.0,
-                            )
-                            for clip in background_entries
-                        ),
-                    )
-                background_max_end = _track_end(background_entries, target_end)
-                if background_max_end > 0.0:
-                    max_content_end = max(max_content_end, background_max_end)
-
-        overlay_nodes = config.get("overlay_nodes")
-        if isinstance(overlay_nodes, dict):
-            for shape, paths in overlay_nodes.items():
+        if head_entries:
+            for clip in head_entries:
+                update_clip(clip, self.settings.head_url)
+            head_max_end = _track_end(head_entries, head_duration)
+            if head_max_end > 0.0:
+                max_content_end = max(max_content_end, head_max_end)
+            mix_lead_in = self._determine_mix_lead_in(template, head_duration, background_meta)
+            if mix_lead_in is not None:
+                self._apply_mix_lead_in_to_head_entries(head_entries, mix_lead_in, head_duration)
+
+        background_entries = [get_node(spec, path, error_cls=PipelineError) for path in config.background_nodes]
+        if background_entries:
+            for clip in background_entries:
+                update_clip(
+                    clip,
+                    self.settings.background_url,
+                    fit_mode,
+                    asset_type=background_meta.asset_type,
+                )
+            if mix_lead_in is not None:
+                self._apply_mix_lead_in_to_background_entries(background_entries, mix_lead_in)
+            if background_meta.asset_type == "video" and self.settings.background_video_mode == "fixed":
+                for clip in background_entries:
+                    clip.pop("match_length_to", None)
+                    clip.pop("auto_length", None)
+                    clip.pop("speed", None)
+                    length_value = max(background_meta.duration - _safe_float(clip.get("trim", 0.0)), 0.0)
+                    clip["length"] = round(max(length_value, 0.1), 3)
+            elif background_meta.asset_type == "video":
+                self._retime_background_entries(background_entries, head_duration, background_meta)
+            target_end = max_content_end if max_content_end > 0.0 else head_duration
+            if background_meta.asset_type == "video" and self.settings.background_video_mode == "fixed":
+                target_end = max(
+                    target_end,
+                    max(
+                        _safe_float(clip.get("start", 0.0)) + max(
+                            background_meta.duration - _safe_float(clip.get("trim", 0.0)),
+                            0.0,
+                        )
+                        for clip in background_entries
+                    ),
+                )
+            background_max_end = _track_end(background_entries, target_end)
+            if background_max_end > 0.0:
+                max_content_end = max(max_content_end, background_max_end)
+
+        if config.overlay_nodes:
+            for shape, paths in config.overlay_nodes.items():
                 overlay_url = overlay_urls.get(shape)
                 if not overlay_url:
                     raise PipelineError(f"Для шаблона {template} нужен оверлей формы '{shape}', но URL не получен.")
@@ -613,58 +790,55 @@ class TalkingHeadPipeline:
                     overlay_url,
                     "contain",
                     error_cls=PipelineError,
-                )  # type: ignore[arg-type]
+                )
         if mix_lead_in is not None:
             self._apply_mix_lead_in_to_talking_head_overlay(spec, mix_lead_in)
 
         if fit_mode == "contain":
-            ensure_background(spec, self.args.background_color)
+            ensure_background(spec, self.settings.background_color)
 
-        if self.args.subtitles_enabled == "none":
+        template_blocks = self.blocks_config.get(template, {})
+        if self.settings.subtitles_enabled == "none":
             spec.pop("subtitles", None)
-        elif self.args.subtitles_enabled == "manual":
-            if subtitles_from_file is not None:
-                spec["subtitles"] = copy.deepcopy(subtitles_from_file)
+        elif self.settings.subtitles_enabled == "manual":
+            if subtitles_blob is not None:
+                spec["subtitles"] = _subtitle_track(_parsed_blob(subtitles_blob))
             else:
                 spec.pop("subtitles", None)
         else:  # auto
-            if subtitles_from_file is not None:
-                spec["subtitles"] = copy.deepcopy(subtitles_from_file)
+            if subtitles_blob is not None:
+                spec["subtitles"] = _subtitle_track(_parsed_blob(subtitles_blob))
             elif self.transcript_text:
-                spec["subtitles"] = auto_subtitles or []
+                spec["subtitles"] = _subtitle_track(auto_subtitles or ())
 
         if max_content_end <= 0.0:
             max_content_end = head_duration
 
         fallback_length = max_content_end or head_duration
-        clips_end = _track_end(spec.get("clips", []), fallback_length)
-        overlays_end = _track_end(spec.get("overlays", []), fallback_length)
+        # Обе дорожки считаются с одним target — достаточно одного прохода по их объединению.
+        tracks_end = _track_end(chain(spec.get("clips", []), spec.get("overlays", [])), fallback_length)
         subtitles_end = _subtitles_end(spec.get("subtitles", []))
-        actual_end = max(clips_end, overlays_end, subtitles_end)
+        actual_end = max(tracks_end, subtitles_end)
         if actual_end > 0.0:
             max_content_end = max(max_content_end, actual_end)
 
         _lock_auto_length(spec.get("clips", []), max_content_end)
 
-        template_blocks = self.blocks_config.get(template, {})
         apply_blocks(spec, template_blocks, max_content_end, error_cls=PipelineError)
 
         cli_blocks = self._build_cli_blocks_for_template(template, intro_settings, outro_settings)
         if cli_blocks:
             apply_blocks(spec, cli_blocks, max_content_end, error_cls=PipelineError)
 
-        spec["subtitle_theme"] = self.args.subtitle_theme
-
-        if config.get("background_nodes") and background_meta.asset_type == "image":
-            intro_total = intro_lengths_by_template.get(template, 0.0)
-            main_length = max(head_duration, 0.1)
-            main_end = intro_total + main_length
-            for path in config["background_nodes"]:
-                clip = get_node(spec, path, error_cls=PipelineError)
-                try:
-                    clip_start = float(clip.get("start", 0.0) or 0.0)
-                except (TypeError, ValueError):
-                    clip_start = 0.0
+        spec["subtitle_theme"] = self.settings.subtitle_theme
+
+        # Картинка-фон дотягивается до конца основного ролика. Проход идёт по тем же
+        # ссылкам background_entries, но после apply_blocks: prepend-блоки сдвигают start,
+        # а длина фона до блоков участвует в max_content_end (позиция append-клипов).
+        if background_entries and background_meta.asset_type == "image":
+            main_end = intro_lengths_by_template.get(template, 0.0) + max(head_duration, 0.1)
+            for clip in background_entries:
+                clip_start = _safe_float(clip.get("start", 0.0))
                 desired_end = main_end if clip_start < main_end else clip_start
                 desired_length = max(desired_end - clip_start, 0.0)
                 clip["length"] = round(max(desired_length, 0.1), 3)
@@ -679,12 +853,14 @@ class TalkingHeadPipeline:
         head_duration: float,
         fit_mode: str,
         overlay_urls: Dict[str, str],
-        subtitles_from_file: Optional[List[Dict[str, object]]],
+        subtitles_blob: Optional[bytes],
         auto_subtitles: Optional[List[Dict[str, object]]],
         intro_settings: Optional[Dict[str, Any]],
         outro_settings: Optional[Dict[str, Any]],
         intro_lengths_by_template: Dict[str, float],
     ) -> List[Path]:
+        # Подготовка шаблона — миллисекунды работы с JSON, поэтому шаблоны идут
+        # последовательно в этом процессе и делят кеши _template_blob/_parsed_blob.
         written_specs: List[Path] = []
         for template in self.templates:
             with timed_step(f"Подготовка шаблона {template}"):
@@ -694,7 +870,7 @@ class TalkingHeadPipeline:
                     head_duration,
                     fit_mode,
                     overlay_urls,
-                    subtitles_from_file,
+                    subtitles_blob,
                     auto_subtitles,
                     intro_settings,
                     outro_settings,
@@ -703,14 +879,22 @@ class TalkingHeadPipeline:
                 written_specs.append(spec_path)
         return written_specs
 
-    def run(self) -> Optional[Dict[str, Dict[str, object]]]:
+    def _resolve_overlay_urls(self) -> Dict[str, str]:
         if self.overlay_provider:
             with timed_step("Генерация оверлеев"):
-                overlay_urls = self.overlay_provider(self.required_shapes)
-        else:
-            overlay_urls = self._generate_overlay_urls()
-        subtitles_from_file = self._load_manual_subtitles()
-        background_meta, head_duration, fit_mode, auto_subtitles = self._prepare_media()
+                return self.overlay_provider(self.required_shapes)
+        return self._generate_overlay_urls()
+
+    def run(self) -> Optional[Dict[str, Dict[str, object]]]:
+        # Оверлеи (сегментация + загрузка в Shotstack) и подготовка медиа не зависят
+        # друг от друга до сборки шаблонов — выполняем их одновременно.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            overlay_future = executor.submit(self._resolve_overlay_urls)
+            media_future = executor.submit(self._prepare_media)
+            subtitles_from_file = self._load_manual_subtitles()
+            subtitles_blob = _freeze(subtitles_from_file) if subtitles_from_file is not None else None
+            background_meta, head_duration, fit_mode, auto_subtitles = media_future.result()
+            overlay_urls = overlay_future.result()
         intro_settings, outro_settings, intro_lengths_by_template = self._prepare_cli_blocks()
 
         written_specs = self._prepare_templates(
@@ -718,14 +902,14 @@ class TalkingHeadPipeline:
             head_duration,
             fit_mode,
             overlay_urls,
-            subtitles_from_file,
+            subtitles_blob,
             auto_subtitles,
             intro_settings,
             outro_settings,
             intro_lengths_by_template,
         )
 
-        if self.args.no_render:
+        if self.settings.no_render:
             print("Рендер отключён (--no-render). Спецификации готовы.")
             return None
 
@@ -26,27 +26,49 @@ from __future__ import annotations
 
 import argparse
 import logging
+import math
 import os
+import queue
+import random
 import subprocess
 import sys
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import IO, Any, Callable, Dict, Iterable, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import cv2  # type: ignore
 import mediapipe as mp  # type: ignore
 import numpy as np
 import requests
+import urllib3
+from requests.adapters import HTTPAdapter
 from PIL import Image  # type: ignore
 
+from common.http import http_session, parallel_download
+
 try:
     from rembg import new_session, remove  # type: ignore
 except ImportError:  # pragma: no cover - optional dependency for rembg engine
     new_session = None  # type: ignore
     remove = None  # type: ignore
 
+try:
+    import onnxruntime  # type: ignore
+except ImportError:  # pragma: no cover - ставится вместе с rembg
+    onnxruntime = None  # type: ignore
+
+try:
+    from numba import njit, prange  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency, numpy fallback below
+    njit = None  # type: ignore
+    prange = range  # type: ignore
+
 # Настройка логгера
 logging.basicConfig(
     level=logging.INFO,
@@ -56,34 +78,731 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def run_ffmpeg(args: list[str]) -> None:
-    result = subprocess.run(["ffmpeg", "-y", *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+TMPFS_DIR = Path("/dev/shm")
+# Исходник и ProRes-выход занимают сотни МБ: в Docker /dev/shm по умолчанию 64 МБ,
+# поэтому tmpfs используется только при достаточном свободном месте.
+TMPFS_MIN_FREE_BYTES = int(os.getenv("OVERLAY_TMPFS_MIN_FREE_MB", "2048")) * 1024 * 1024
 
 
-def download_file(url: str, dest: Path) -> None:
-    start_time = time.time()
-    downloaded_bytes = 0
-    
-    with requests.get(url, stream=True, timeout=60) as response:
-        response.raise_for_status()
-        with open(dest, "wb") as handle:
-            for chunk in response.iter_content(chunk_size=8192):
-                handle.write(chunk)
-                downloaded_bytes += len(chunk)
-    
-    duration = time.time() - start_time
-    size_mb = downloaded_bytes / (1024 * 1024)
-    logger.info(f"[PREPARE_OVERLAY] ⏱️ Downloaded {size_mb:.1f}MB in {duration:.2f}s")
+def scratch_dir() -> Optional[str]:
+    """
+    Каталог для временных файлов оверлея: OVERLAY_TMP_DIR, иначе /dev/shm при
+    достаточном запасе места, иначе None (системный tempdir на диске).
+    """
+    override = os.getenv("OVERLAY_TMP_DIR")
+    if override:
+        return override
+    try:
+        stats = os.statvfs(TMPFS_DIR)
+    except (OSError, AttributeError):
+        return None
+    if stats.f_bavail * stats.f_frsize < TMPFS_MIN_FREE_BYTES or not os.access(TMPFS_DIR, os.W_OK):
+        return None
+    return str(TMPFS_DIR)
 
 
-def build_alpha_clip(
+# Порядок предпочтения провайдеров ONNX Runtime: GPU, если он есть, иначе CPU.
+# OVERLAY_REMBG_PROVIDERS (через запятую) переопределяет список, например
+# "DmlExecutionProvider,CPUExecutionProvider" на Windows.
+REMBG_PROVIDERS = tuple(
+    provider.strip()
+    for provider in os.getenv(
+        "OVERLAY_REMBG_PROVIDERS",
+        "CUDAExecutionProvider,CoreMLExecutionProvider,CPUExecutionProvider",
+    ).split(",")
+    if provider.strip()
+)
+_REMBG_SESSIONS: Dict[str, Any] = {}
+_REMBG_SESSIONS_LOCK = threading.Lock()
+
+
+def get_rembg_session(model_name: str) -> Any:
+    """
+    Сессия rembg на модель, одна на процесс: загрузка и прогрев ONNX-графа
+    стоят около секунды и не повторяются при каждом build_alpha_clips.
+    """
+    if new_session is None or remove is None:
+        raise RuntimeError("rembg is not installed. Run `pip install rembg onnxruntime Pillow` to enable this engine.")
+    with _REMBG_SESSIONS_LOCK:
+        session = _REMBG_SESSIONS.get(model_name)
+        if session is None:
+            available = set(onnxruntime.get_available_providers()) if onnxruntime is not None else set()
+            providers = [provider for provider in REMBG_PROVIDERS if provider in available] or None
+            session = new_session(model_name=model_name, providers=providers)
+            _REMBG_SESSIONS[model_name] = session
+            logger.info(f"[PREPARE_OVERLAY] 📊 rembg session {model_name}: {', '.join(providers or ['default'])}")
+        return session
+
+
+# Модели семейства u2net (вход 320x320, нормализация ImageNet) без alpha matting
+# прогоняются напрямую через ONNX-сессию rembg — так же, как U2netSession.predict.
+REMBG_DIRECT_MODELS = frozenset({"u2net", "u2netp", "u2net_human_seg"})
+REMBG_INPUT_SIZE = (320, 320)
+_REMBG_MEAN = np.array((0.485, 0.456, 0.406), dtype=np.float32)
+_REMBG_STD = np.array((0.229, 0.224, 0.225), dtype=np.float32)
+
+
+def _rembg_input(rgb: np.ndarray) -> np.ndarray:
+    sample = cv2.resize(rgb, REMBG_INPUT_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+    peak = float(sample.max())
+    if peak > 0.0:
+        sample *= 1.0 / peak
+    sample -= _REMBG_MEAN
+    sample /= _REMBG_STD
+    return sample.transpose(2, 0, 1)
+
+
+def _rembg_output(prediction: np.ndarray, height: int, width: int) -> np.ndarray:
+    low, high = float(prediction.min()), float(prediction.max())
+    if high <= low:
+        return np.zeros((height, width), dtype=np.float32)
+    prediction = ((prediction - low) / (high - low)).astype(np.float32)
+    return cv2.resize(prediction, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def rembg_direct_masks(session: Any, rgbs: List[np.ndarray]) -> List[np.ndarray]:
+    """
+    Маски u2net в [0, 1] размером с кадры: подготовка входа и ресайзы через cv2,
+    без PIL-конвертаций и квантования маски в uint8, которые делает rembg.remove.
+    Если batch-измерение модели динамическое, кадры идут одним вызовом ONNX Runtime.
+    """
+    inner = session.inner_session
+    model_input = inner.get_inputs()[0]
+    batch_dim = model_input.shape[0] if model_input.shape else None
+    if isinstance(batch_dim, int) and batch_dim != len(rgbs):
+        return [mask for rgb in rgbs for mask in rembg_direct_masks(session, [rgb])]
+    tensor = np.stack([_rembg_input(rgb) for rgb in rgbs])
+    predictions = inner.run(None, {model_input.name: tensor})[0][:, 0]
+    return [_rembg_output(prediction, *rgb.shape[:2]) for prediction, rgb in zip(predictions, rgbs)]
+
+
+# Глубина очередей между стадиями кадрового конвейера: 8 кадров 1080p BGR+RGB
+# держат в памяти ~100 МБ и сглаживают разницу в скорости стадий.
+FRAME_QUEUE_SIZE = 8
+_END_OF_STREAM = object()
+# Сессии mediapipe для параллельной сегментации пачки кадров; 1 — последовательно.
+SEGMENTATION_WORKERS = max(1, int(os.getenv("OVERLAY_SEGMENTATION_WORKERS", "0")) or (os.cpu_count() or 2) // 2)
+SEGMENTATION_BATCH = 8
+# Пропуск сегментации на почти неподвижных кадрах: средняя |разница| яркости
+# (0-255) миниатюры 64x64 с кадром, чья маска переиспользуется; 0 — выключено.
+STATIC_SKIP_THRESHOLD = float(os.getenv("OVERLAY_STATIC_SKIP_THRESHOLD", "1.0"))
+STATIC_SKIP_REFRESH = 10
+STATIC_GATE_SIZE = (64, 64)
+# Масштаб маски для порога, морфологии и центроида относительно кадра; 1 — полный размер.
+MASK_SCALE = min(1.0, max(0.1, float(os.getenv("OVERLAY_MASK_SCALE", "0.5"))))
+# Детекция лица для авто-центра круга раз в N кадров: положение круга и так
+# сглаживается EMA, между запусками используется последний результат.
+FACE_DETECT_STRIDE = max(1, int(os.getenv("OVERLAY_FACE_DETECT_STRIDE", "5")))
+
+
+def _queue_put(target: "queue.Queue[Any]", item: Any, stop: threading.Event) -> bool:
+    """Положить элемент, не зависая навсегда, если соседняя стадия уже остановилась."""
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _queue_get(source: "queue.Queue[Any]", stop: threading.Event) -> Any:
+    while True:
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return _END_OF_STREAM
+
+
+# Аппаратное декодирование исходника (cuda, videotoolbox, vaapi...). "auto"
+# молча откатывается на программный декодер, "none" отключает -hwaccel совсем.
+DECODE_HWACCEL = os.getenv("OVERLAY_HWACCEL", "auto").strip() or "none"
+# Сколько байт stderr декодера попадает в текст ошибки: при сбое ffmpeg
+# причина обычно в последних строках.
+DECODE_ERROR_TAIL_BYTES = 4096
+
+
+class _RgbDecoder:
+    """
+    Декодирование исходника ffmpeg сразу в rgb24 через stdout: кадры приходят
+    в порядке каналов mediapipe/rembg без BGR->RGB. read() повторяет контракт
+    cv2.VideoCapture.read: (успех, кадр), с записью в переданный буфер.
+    Если ffmpeg завершился с ошибкой, read() в конце потока поднимает
+    RuntimeError с хвостом его stderr, а не молча обрывает ролик.
+    """
+
+    def __init__(self, source_path: Path, width: int, height: int) -> None:
+        self.shape = (height, width, 3)
+        self.frame_bytes = width * height * 3
+        hwaccel = ["-hwaccel", DECODE_HWACCEL] if DECODE_HWACCEL != "none" else []
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-nostdin",
+                "-v",
+                "error",
+                *hwaccel,
+                "-i",
+                str(source_path),
+                "-map",
+                "0:v:0",
+                "-vsync",
+                "passthrough",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                "rgb24",
+                "pipe:1",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=self.log,
+        )
+
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[bool, np.ndarray]:
+        if out is None:
+            out = np.empty(self.shape, dtype=np.uint8)
+        if not self.frame_bytes:
+            return False, out
+        view = memoryview(out).cast("B")
+        filled = 0
+        while filled < self.frame_bytes:
+            count = self.process.stdout.readinto(view[filled:])
+            if not count:
+                if self.process.wait() != 0:
+                    raise self._error()
+                return False, out
+            filled += count
+        return True, out
+
+    def _error(self) -> RuntimeError:
+        size = self.log.seek(0, os.SEEK_END)
+        self.log.seek(max(0, size - DECODE_ERROR_TAIL_BYTES))
+        details = self.log.read().decode("utf-8", errors="replace").strip()
+        return RuntimeError(f"ffmpeg decode failed (exit code {self.process.returncode}): {details}")
+
+    def release(self) -> None:
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+        self.log.close()
+
+
+def _frame_reader(
+    decoder: _RgbDecoder,
+    read_q: "queue.Queue[Any]",
+    stop: threading.Event,
+    errors: List[BaseException],
+    gate_frames: bool = False,
+) -> None:
+    """Стадия чтения: декодирование и миниатюра для гейтинга идут параллельно с сегментацией."""
+    # Буферы кадров переиспользуются по кругу. Одновременно живы не больше
+    # FRAME_QUEUE_SIZE кадров в очереди, пачка сегментации и один читаемый,
+    # поэтому к моменту повторного использования слот уже обработан.
+    ring_size = FRAME_QUEUE_SIZE + SEGMENTATION_BATCH + 2
+    rgb_ring: List[np.ndarray] = []
+    slot = 0
+    try:
+        while not stop.is_set():
+            if slot < len(rgb_ring):
+                success, rgb = decoder.read(rgb_ring[slot])
+                if not success:
+                    break
+            else:
+                success, rgb = decoder.read()
+                if not success:
+                    break
+                rgb_ring.append(rgb)
+            slot = (slot + 1) % ring_size
+            small = None
+            if gate_frames:
+                gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+                small = cv2.resize(gray, STATIC_GATE_SIZE, interpolation=cv2.INTER_AREA)
+            if not _queue_put(read_q, (rgb, small), stop):
+                return
+    except BaseException as exc:
+        errors.append(exc)
+        stop.set()
+    finally:
+        _queue_put(read_q, _END_OF_STREAM, stop)
+
+
+def _next_frame_batch(
+    read_q: "queue.Queue[Any]",
+    stop: threading.Event,
+    size: int,
+) -> Tuple[List[Any], bool]:
+    """Собрать до size кадров; второй элемент — признак конца потока."""
+    batch: List[Any] = []
+    while len(batch) < size:
+        item = _queue_get(read_q, stop)
+        if item is _END_OF_STREAM:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+def _frame_writer(
+    write_q: "queue.Queue[Any]",
+    write_frame: Callable[[str, int, np.ndarray], None],
+    stop: threading.Event,
+    errors: List[BaseException],
+) -> None:
+    """Стадия записи: кодирование готовых BGRA-кадров не задерживает сегментацию."""
+    try:
+        while True:
+            item = _queue_get(write_q, stop)
+            if item is _END_OF_STREAM:
+                return
+            write_frame(*item)
+    except BaseException as exc:
+        errors.append(exc)
+        stop.set()
+
+
+CENTER_MASK_THRESHOLD = 0.25
+CenterStats = Tuple[float, float, float, int, int, int, int]
+
+
+def _centroid_and_bbox_numpy(weights: np.ndarray, threshold: float) -> CenterStats:
+    # Взвешенные суммы через проекции на оси: без H×W временных массивов координат.
+    col_weights = weights.sum(axis=0, dtype=np.float64)
+    row_weights = weights.sum(axis=1, dtype=np.float64)
+    sum_w = float(col_weights.sum())
+    sum_wx = float(col_weights @ np.arange(col_weights.size, dtype=np.float64))
+    sum_wy = float(row_weights @ np.arange(row_weights.size, dtype=np.float64))
+    mask_binary = weights > threshold
+    cols = np.flatnonzero(mask_binary.any(axis=0))
+    rows = np.flatnonzero(mask_binary.any(axis=1))
+    if not cols.size or not rows.size:
+        return sum_w, sum_wx, sum_wy, -1, -1, -1, -1
+    return sum_w, sum_wx, sum_wy, int(cols[0]), int(cols[-1]), int(rows[0]), int(rows[-1])
+
+
+# Ядра numba отпускают GIL (nogil), поэтому идут параллельно с потоками
+# чтения/записи кадров и инференсом сегментации.
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, boundscheck=False, nogil=True, cache=True)
+    def _centroid_and_bbox_jit(weights, threshold):  # pragma: no cover - компилируется numba
+        height, width = weights.shape
+        sum_w = 0.0
+        sum_wx = 0.0
+        sum_wy = 0.0
+        x_min = width
+        x_max = -1
+        y_min = height
+        y_max = -1
+        for y in prange(height):
+            row_w = 0.0
+            row_wx = 0.0
+            row_min = width
+            row_max = -1
+            for x in range(width):
+                value = weights[y, x]
+                row_w += value
+                row_wx += value * x
+                if value > threshold:
+                    if x < row_min:
+                        row_min = x
+                    row_max = x
+            sum_w += row_w
+            sum_wx += row_wx
+            sum_wy += row_w * y
+            # Редукции min/max безусловные: пустая строка даёт нейтральные значения.
+            x_min = min(x_min, row_min)
+            x_max = max(x_max, row_max)
+            y_min = min(y_min, y if row_max >= 0 else height)
+            y_max = max(y_max, y if row_max >= 0 else -1)
+        return sum_w, sum_wx, sum_wy, x_min, x_max, y_min, y_max
+
+
+def centroid_and_bbox(weights: np.ndarray, threshold: float = CENTER_MASK_THRESHOLD) -> CenterStats:
+    """
+    Сумма весов маски, взвешенные суммы по x/y и bbox пикселей выше порога
+    (x_min, x_max, y_min, y_max; -1, если таких нет) за один проход по кадру.
+    """
+    if njit is None:
+        return _centroid_and_bbox_numpy(weights, threshold)
+    sum_w, sum_wx, sum_wy, x_min, x_max, y_min, y_max = _centroid_and_bbox_jit(
+        np.ascontiguousarray(weights, dtype=np.float32), np.float32(threshold)
+    )
+    if x_max < 0:
+        return float(sum_w), float(sum_wx), float(sum_wy), -1, -1, -1, -1
+    return float(sum_w), float(sum_wx), float(sum_wy), int(x_min), int(x_max), int(y_min), int(y_max)
+
+
+# Бинарная маска в упакованном виде: бит j слова k строки — пиксель x = 64k + j.
+# Морфология 5x5-эллипсом идёт над 64 пикселями за операцию (SWAR).
+MASK_WORD_BITS = 64
+
+
+def _packed_width(width: int) -> int:
+    return -(-width // MASK_WORD_BITS)
+
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, boundscheck=False, nogil=True, cache=True)
+    def _pack_threshold(mask, threshold, packed):  # pragma: no cover - компилируется numba
+        height, width = mask.shape
+        words = packed.shape[1]
+        for y in prange(height):
+            for k in range(words):
+                word = np.uint64(0)
+                base = k * 64
+                limit = min(64, width - base)
+                for j in range(limit):
+                    if mask[y, base + j] >= threshold:
+                        word |= np.uint64(1) << np.uint64(j)
+                packed[y, k] = word
+
+    @njit(boundscheck=False, nogil=True, cache=True, inline="always")
+    def _shifted_word(row, k, shift, fill):  # pragma: no cover - компилируется numba
+        # Пиксель x получает значение пикселя x + shift; за краем строки — fill.
+        words = row.shape[0]
+        if shift > 0:
+            following = row[k + 1] if k + 1 < words else fill
+            return (row[k] >> np.uint64(shift)) | (following << np.uint64(64 - shift))
+        preceding = row[k - 1] if k > 0 else fill
+        return (row[k] << np.uint64(-shift)) | (preceding >> np.uint64(64 + shift))
+
+    @njit(parallel=True, boundscheck=False, nogil=True, cache=True)
+    def _morph_step(src, rows, dst, width, dilate):  # pragma: no cover - компилируется numba
+        """
+        Одна дилатация или эрозия 5x5-эллипсом cv2 (= прямоугольник 3x5 ∪ столбец 5x1).
+        Пиксели за краем кадра не влияют на результат, как у cv2 с рамкой по умолчанию.
+        """
+        height, words = src.shape
+        fill = np.uint64(0) if dilate else ~np.uint64(0)
+        tail = width - (words - 1) * 64
+        tail_mask = ~np.uint64(0) if tail == 64 else (np.uint64(1) << np.uint64(tail)) - np.uint64(1)
+        for y in prange(height):
+            # Биты хвоста последнего слова ведут себя как пиксели за краем.
+            src[y, words - 1] = (src[y, words - 1] & tail_mask) | (fill & ~tail_mask)
+        for y in prange(height):
+            row = src[y]
+            for k in range(words):
+                acc = row[k]
+                for shift in (-2, -1, 1, 2):
+                    if dilate:
+                        acc |= _shifted_word(row, k, shift, fill)
+                    else:
+                        acc &= _shifted_word(row, k, shift, fill)
+                rows[y, k] = acc
+        for y in prange(height):
+            for k in range(words):
+                acc = rows[y, k]
+                for dy in (-1, 1):
+                    yy = y + dy
+                    value = rows[yy, k] if 0 <= yy < height else fill
+                    acc = acc | value if dilate else acc & value
+                for dy in (-2, 2):
+                    yy = y + dy
+                    value = src[yy, k] if 0 <= yy < height else fill
+                    acc = acc | value if dilate else acc & value
+                dst[y, k] = acc
+
+    @njit(parallel=True, boundscheck=False, nogil=True, cache=True)
+    def _apply_packed(mask, packed, out):  # pragma: no cover - компилируется numba
+        height, width = mask.shape
+        for y in prange(height):
+            for x in range(width):
+                bit = (packed[y, x >> 6] >> np.uint64(x & 63)) & np.uint64(1)
+                out[y, x] = mask[y, x] if bit else np.float32(0.0)
+
+
+def refine_mask(
+    mask: np.ndarray,
+    threshold: float,
+    kernel: np.ndarray,
+    buffers: "_FrameBuffers",
+    morphology: bool = True,
+) -> np.ndarray:
+    """
+    mask * open(close(mask >= threshold)) в buffers.alpha (без morphology — просто
+    mask * (mask >= threshold)). С numba бинарная маска живёт в упакованных битах;
+    без неё — тот же расчёт через cv2.morphologyEx.
+    """
+    if njit is None:
+        np.greater_equal(mask, threshold, out=buffers.binary)
+        if morphology:
+            cv2.morphologyEx(buffers.binary, cv2.MORPH_CLOSE, kernel, dst=buffers.morph, iterations=1)
+            cv2.morphologyEx(buffers.morph, cv2.MORPH_OPEN, kernel, dst=buffers.binary, iterations=1)
+        return np.multiply(mask, buffers.binary, out=buffers.alpha)
+
+    width = mask.shape[1]
+    packed, spare, rows = buffers.packed, buffers.packed_spare, buffers.packed_rows
+    _pack_threshold(mask, np.float32(threshold), packed)
+    if morphology:
+        # close = erode(dilate(x)), open = dilate(erode(x)).
+        _morph_step(packed, rows, spare, width, True)
+        _morph_step(spare, rows, packed, width, False)
+        _morph_step(packed, rows, spare, width, False)
+        _morph_step(spare, rows, packed, width, True)
+    _apply_packed(mask, packed, buffers.alpha)
+    return buffers.alpha
+
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, boundscheck=False, nogil=True, cache=True)
+    def _alpha_to_u8_jit(alpha, out):  # pragma: no cover - компилируется numba
+        height, width = alpha.shape
+        for y in prange(height):
+            for x in range(width):
+                value = alpha[y, x] * np.float32(255.0)
+                out[y, x] = np.uint8(min(max(value, np.float32(0.0)), np.float32(255.0)))
+
+
+def alpha_to_u8(alpha: np.ndarray, buffers: "_FrameBuffers") -> np.ndarray:
+    """
+    Альфа [0, 1] -> uint8 в buffers.alpha_u8: умножение на 255, clip и
+    приведение типа за один проход вместо трёх (без numba — тремя вызовами numpy).
+    """
+    if njit is None:
+        scaled = np.multiply(alpha, 255.0, out=buffers.scaled)
+        np.clip(scaled, 0, 255, out=scaled)
+        np.copyto(buffers.alpha_u8, scaled, casting="unsafe")
+        return buffers.alpha_u8
+    _alpha_to_u8_jit(alpha, buffers.alpha_u8)
+    return buffers.alpha_u8
+
+
+def feather_box_size(feather: int) -> int:
+    """
+    Нечётная ширина box-фильтра, три прохода которого по дисперсии совпадают с
+    GaussianBlur(feather x feather) при sigma по умолчанию cv2 (для 7 — окно 3).
+    """
+    if feather <= 1:
+        return 1
+    sigma = 0.3 * ((feather - 1) * 0.5 - 1) + 0.8
+    return max(3, 2 * int(round((math.sqrt(4.0 * sigma * sigma + 1.0) - 1.0) / 2.0)) + 1)
+
+
+def mask_work_shape(shape: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    """Размер (h, w), в котором маска проходит порог и морфологию."""
+    if scale >= 1.0:
+        return shape
+    height, width = shape
+    return max(1, round(height * scale)), max(1, round(width * scale))
+
+
+CIRCLE_SHIFT = 4
+CIRCLE_SUBPIXEL = 1 << CIRCLE_SHIFT
+
+
+# Готовый BGRA-кадр уходит в очередь записи, поэтому на форму держится кольцо
+# буферов: очередь + кадр у писателя + заполняемый сейчас.
+BGRA_RING_SIZE = FRAME_QUEUE_SIZE + 2
+
+
+@dataclass
+class _FrameBuffers:
+    """
+    Рабочие массивы постобработки, выделяемые один раз на размер кадра.
+    Порог и морфология идут в уменьшенном размере маски, остальное — в размере кадра.
+    """
+
+    mask_small: np.ndarray
+    binary: np.ndarray
+    morph: np.ndarray
+    alpha: np.ndarray
+    circle_mask: np.ndarray
+    circle_alpha: np.ndarray
+    scaled: np.ndarray
+    alpha_u8: np.ndarray
+    alpha_full: np.ndarray
+    packed: np.ndarray
+    packed_spare: np.ndarray
+    packed_rows: np.ndarray
+    bgra_rings: Dict[str, List[np.ndarray]]
+    bgra_slots: Dict[str, int]
+
+    @classmethod
+    def allocate(
+        cls, shape: Tuple[int, int], mask_shape: Tuple[int, int], shapes: Iterable[str]
+    ) -> "_FrameBuffers":
+        height, width = shape
+        mask_height, mask_width = mask_shape
+        return cls(
+            mask_small=np.empty(mask_shape, dtype=np.float32),
+            binary=np.empty(mask_shape, dtype=np.uint8),
+            morph=np.empty(mask_shape, dtype=np.uint8),
+            alpha=np.empty(mask_shape, dtype=np.float32),
+            circle_mask=np.zeros((height, width), dtype=np.uint8),
+            circle_alpha=np.empty((height, width), dtype=np.uint8),
+            scaled=np.empty(mask_shape, dtype=np.float32),
+            alpha_u8=np.empty(mask_shape, dtype=np.uint8),
+            alpha_full=np.empty((height, width), dtype=np.uint8),
+            packed=np.empty((mask_height, _packed_width(mask_width)), dtype=np.uint64),
+            packed_spare=np.empty((mask_height, _packed_width(mask_width)), dtype=np.uint64),
+            packed_rows=np.empty((mask_height, _packed_width(mask_width)), dtype=np.uint64),
+            bgra_rings={
+                name: [np.empty((height, width, 4), dtype=np.uint8) for _ in range(BGRA_RING_SIZE)]
+                for name in shapes
+            },
+            bgra_slots={name: 0 for name in shapes},
+        )
+
+    def next_bgra(self, shape: str) -> np.ndarray:
+        slot = self.bgra_slots[shape]
+        self.bgra_slots[shape] = (slot + 1) % BGRA_RING_SIZE
+        return self.bgra_rings[shape][slot]
+
+
+def _alpha_codec_args(container: str) -> list[str]:
+    if container == "webm":
+        return [
+            "-c:v",
+            "libvpx-vp9",
+            "-pix_fmt",
+            "yuva420p",
+            "-auto-alt-ref",
+            "0",
+            # Многопоточный realtime-пресет: однопоточный libvpx с альфой был самым
+            # медленным этапом. Аппаратные VP9-энкодеры альфу не поддерживают.
+            "-row-mt",
+            "1",
+            "-tile-columns",
+            "4",
+            "-threads",
+            str(os.cpu_count() or 1),
+            "-deadline",
+            "realtime",
+            "-cpu-used",
+            "5",
+            # Без lookahead кадры уходят в выход сразу, а не копятся в очереди кодека.
+            "-lag-in-frames",
+            "0",
+            "-frame-parallel",
+            "1",
+            "-c:a",
+            "libopus",
+            "-b:a",
+            "128k",
+        ]
+    return [
+        "-c:v",
+        "prores_ks",
+        "-profile:v",
+        "4444",
+        "-pix_fmt",
+        "yuva444p10le",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "192k",
+        "-movflags",
+        "+faststart",
+    ]
+
+
+@dataclass
+class _AlphaEncoder:
+    """ffmpeg, принимающий сырые BGRA-кадры формы через stdin."""
+
+    shape: str
+    process: subprocess.Popen
+    log: IO[bytes]
+    output_path: Path
+    started: float
+
+
+def _start_alpha_encoder(
+    shape: str,
+    width: int,
+    height: int,
+    fps: float,
     source_path: Path,
-    frames_dir: Path,
-    audio_path: Path,
     alpha_video_path: Path,
     container: str,
+) -> _AlphaEncoder:
+    logger.info(f"[PREPARE_OVERLAY] ▶️ Encoding {shape} alpha video ({container})")
+    args = [
+        "ffmpeg",
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "bgra",
+        "-s",
+        f"{width}x{height}",
+        "-framerate",
+        f"{fps}",
+        "-i",
+        "pipe:0",
+        # Звук берётся прямо из исходника: отдельное извлечение в m4a не нужно,
+        # аудиодорожка всё равно перекодируется в opus/aac.
+        "-i",
+        str(source_path),
+        "-map",
+        "0:v:0",
+        "-map",
+        "1:a:0?",
+        *_alpha_codec_args(container),
+        str(alpha_video_path),
+    ]
+    # stderr уходит во временный файл: PIPE, который никто не читает до конца
+    # кодирования, может заполниться и остановить ffmpeg.
+    log = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=log)
+    except BaseException:
+        log.close()
+        raise
+    return _AlphaEncoder(shape, process, log, alpha_video_path, time.time())
+
+
+def _encoder_error(encoder: _AlphaEncoder) -> RuntimeError:
+    encoder.log.seek(0)
+    details = encoder.log.read().decode("utf-8", errors="replace").strip()
+    return RuntimeError(f"ffmpeg failed ({encoder.shape}): {details}")
+
+
+def _write_alpha_frame(encoder: _AlphaEncoder, image: np.ndarray) -> None:
+    assert encoder.process.stdin is not None
+    try:
+        encoder.process.stdin.write(image.data)
+    except BrokenPipeError as exc:
+        encoder.process.wait()
+        raise _encoder_error(encoder) from exc
+
+
+def _finish_alpha_encoder(encoder: _AlphaEncoder) -> None:
+    try:
+        assert encoder.process.stdin is not None
+        try:
+            encoder.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if encoder.process.wait() != 0:
+            raise _encoder_error(encoder)
+    finally:
+        encoder.log.close()
+
+    encode_duration = time.time() - encoder.started
+    logger.info(f"[PREPARE_OVERLAY] ⏱️ {encoder.shape} video encoded in {encode_duration:.2f}s")
+
+    output_size = encoder.output_path.stat().st_size
+    size_mb = output_size / (1024 * 1024)
+    logger.info(f"[PREPARE_OVERLAY] 📊 {encoder.shape} output size: {size_mb:.1f}MB")
+
+
+def _abort_alpha_encoder(encoder: _AlphaEncoder) -> None:
+    encoder.process.kill()
+    encoder.process.wait()
+    encoder.log.close()
+
+
+def build_alpha_clips(
+    source_path: Path,
+    targets: Dict[str, Path],
+    container: str,
     threshold: float,
     feather: int,
     debug: bool,
@@ -94,269 +813,435 @@ def build_alpha_clip(
     rembg_bg_threshold: int,
     rembg_erode_size: int,
     rembg_base_size: int,
-    shape: str,
     circle_radius: float,
     circle_center_x: float,
     circle_center_y: float,
     circle_auto_center: bool,
+    static_skip_threshold: float = STATIC_SKIP_THRESHOLD,
+    face_detect_stride: int = FACE_DETECT_STRIDE,
+    mask_scale: float = MASK_SCALE,
+    mask_morphology: bool = False,
 ) -> float:
+    """
+    Построить альфа-клипы сразу для нескольких форм за один проход по видео.
+
+    targets: shape -> итоговый файл. Декодирование, сегментация и доработка маски
+    выполняются один раз на кадр, различается только маска формы. Кадры идут
+    в ffmpeg сырым BGRA через stdin, без промежуточных PNG на диске.
+    """
+    # cv2 здесь только читает метаданные; кадры декодирует _RgbDecoder.
     cap = cv2.VideoCapture(str(source_path))
     fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
 
-    segmentation: Optional[mp.solutions.selfie_segmentation.SelfieSegmentation] = None
+    segmentations: List[mp.solutions.selfie_segmentation.SelfieSegmentation] = []
     rembg_session = None
+    rembg_direct = False
     face_detection: Optional[mp.solutions.face_detection.FaceDetection] = None
     if engine == "mediapipe":
-        segmentation = mp.solutions.selfie_segmentation.SelfieSegmentation(model_selection=1)
+        # Граф mediapipe не реентерабелен: у каждого потока инференса своя сессия.
+        segmentations = [
+            mp.solutions.selfie_segmentation.SelfieSegmentation(model_selection=1)
+            for _ in range(SEGMENTATION_WORKERS)
+        ]
     elif engine == "rembg":
-        if new_session is None or remove is None:
-            raise RuntimeError("rembg is not installed. Run `pip install rembg onnxruntime Pillow` to enable this engine.")
-        rembg_session = new_session(model_name=rembg_model)
+        rembg_session = get_rembg_session(rembg_model)
+        rembg_direct = (
+            not rembg_alpha_matting
+            and rembg_model in REMBG_DIRECT_MODELS
+            and hasattr(rembg_session, "inner_session")
+        )
+        if rembg_direct:
+            logger.info(f"[PREPARE_OVERLAY] 📊 rembg {rembg_model}: direct ONNX inference")
     else:
         raise ValueError(f"Unsupported engine: {engine}")
 
-    if shape == "circle" and circle_auto_center:
+    if "circle" in targets and circle_auto_center:
         face_detection = mp.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
 
     kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
     feather = max(0, feather)
     if feather % 2 == 0 and feather != 0:
         feather += 1
+    feather_box = feather_box_size(feather)
 
-    # Подсчет общего количества кадров
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     logger.info(f"[PREPARE_OVERLAY] 📊 Processing {total_frames} frames with {engine}")
-    logger.info(f"[PREPARE_OVERLAY] 📊 Shape: {shape}, FPS: {fps:.1f}")
-    if shape == "circle" and circle_auto_center:
+    logger.info(f"[PREPARE_OVERLAY] 📊 Shapes: {', '.join(targets)}, FPS: {fps:.1f}")
+    if "circle" in targets and circle_auto_center:
         logger.info(f"[PREPARE_OVERLAY] 📊 Circle auto-centering: ENABLED")
     
+    if njit is not None:
+        # JIT-компиляция (или загрузка из кеша) до цикла, а не на первом кадре.
+        warmup = np.zeros((16, 16), dtype=np.float32)
+        warmup_buffers = _FrameBuffers.allocate(warmup.shape, warmup.shape, ())
+        alpha_to_u8(refine_mask(warmup, threshold, kernel, warmup_buffers), warmup_buffers)
+        if "circle" in targets and circle_auto_center:
+            centroid_and_bbox(warmup)
+
     index = 0
-    running_cx: Optional[float] = None
-    running_cy: Optional[float] = None
-    running_radius: Optional[float] = None
-    coord_cache: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    # Сглаженное состояние круга (cx, cy, radius) одним вектором float32.
+    circle_state: Optional[np.ndarray] = None
+    # Последний результат детекции лица, переиспользуется между запусками детектора.
+    face_params: Optional[Tuple[float, float, float]] = None
+    face_detect_stride = max(1, face_detect_stride)
+    mask_scale = min(1.0, max(0.1, mask_scale))
+    # Маска selfie-модели mediapipe и так гладкая, открытие/закрытие почти ничего
+    # в ней не меняет; соль-перец бывает у u2net, поэтому для rembg морфология остаётся.
+    morphology = mask_morphology or engine == "rembg"
+    # Маска круга по ключу (h, w, cx, cy, radius): без авто-центра параметры
+    # постоянны, и маска строится один раз на клип.
+    circle_key: Optional[Tuple[int, int, int, int, int]] = None
+    buffers: Optional[_FrameBuffers] = None
     last_progress_time = time.time()
     last_logged_percent = 0
     frame_start_time = time.time()
     
-    while True:
-        success, frame = cap.read()
-        if not success:
-            break
-
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        if engine == "mediapipe":
-            assert segmentation is not None
-            mask = segmentation.process(rgb).segmentation_mask.astype(np.float32)
-        else:
-            assert rembg_session is not None
-            mask_image = remove(
-                Image.fromarray(rgb),
-                session=rembg_session,
-                only_mask=True,
-                alpha_matting=rembg_alpha_matting,
-                alpha_matting_foreground_threshold=rembg_fg_threshold,
-                alpha_matting_background_threshold=rembg_bg_threshold,
-                alpha_matting_erode_structure_size=rembg_erode_size,
-                alpha_matting_base_size=rembg_base_size,
-            )
-            mask = np.asarray(mask_image, dtype=np.float32) / 255.0
-
-        mask = np.clip(mask, 0.0, 1.0)
-        
-        face_params: Optional[Tuple[float, float, float]] = None
-        if face_detection is not None:
-            detection_result = face_detection.process(rgb)
-            if detection_result and detection_result.detections:
-                bbox = detection_result.detections[0].location_data.relative_bounding_box
-                x_min = max(0.0, bbox.xmin)
-                y_min = max(0.0, bbox.ymin)
-                box_width = max(0.0, bbox.width)
-                box_height = max(0.0, bbox.height)
-                if box_width > 0 and box_height > 0:
-                    cx_face = (x_min + box_width * 0.5) * (w := mask.shape[1])
-                    cy_face = (y_min + box_height * 0.5) * (h := mask.shape[0])
-                    radius_face = max(box_width, box_height) * min(h, w) * (0.55 * 2.5)
-                    face_params = (cx_face, cy_face, radius_face)
-
-        weights = mask
-        binary = (mask >= threshold).astype(np.uint8)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel, iterations=1)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, iterations=1)
-
-        refined_mask = mask * binary
-        alpha_float = np.clip(refined_mask, 0.0, 1.0)
-        if feather:
-            alpha_float = cv2.GaussianBlur(alpha_float, (feather, feather), 0)
-        if shape == "circle":
-            h, w = alpha_float.shape
-            min_dim = float(min(w, h))
-            if circle_auto_center:
-                if face_params is not None:
-                    cx_frame, cy_frame, radius_px_frame = face_params
-                else:
-                    if coord_cache is None or coord_cache[0].shape != alpha_float.shape:
-                        ys_coords, xs_coords = np.indices(alpha_float.shape, dtype=np.float32)
-                        coord_cache = (ys_coords, xs_coords)
-                    else:
-                        ys_coords, xs_coords = coord_cache
-
-                    total_weight = float(weights.sum())
-                    if total_weight > 0.0:
-                        cx_frame = float((weights * xs_coords).sum() / total_weight)
-                        cy_frame = float((weights * ys_coords).sum() / total_weight)
-
-                        mask_binary = weights > 0.25
-                        if mask_binary.any():
-                            cols = np.where(np.any(mask_binary, axis=0))[0]
-                            rows = np.where(np.any(mask_binary, axis=1))[0]
-                            if cols.size and rows.size:
-                                width_span = float(cols[-1] - cols[0])
-                                height_span = float(rows[-1] - rows[0])
-                                radius_px_frame = min(width_span, height_span) * 0.5
-                            else:
-                                radius_px_frame = min_dim * max(circle_radius, 0.25)
-                        else:
-                            radius_px_frame = min_dim * max(circle_radius, 0.25)
-                    else:
-                        cx_frame = np.clip(circle_center_x, 0.0, 1.0) * (w - 1)
-                        cy_frame = np.clip(circle_center_y, 0.0, 1.0) * (h - 1)
-                        radius_px_frame = min_dim * max(circle_radius, 0.25)
-
-                if running_cx is None:
-                    running_cx = cx_frame
-                    running_cy = cy_frame
-                    running_radius = radius_px_frame
+    # Энкодер формы стартует на первом кадре: размер берётся из самого кадра,
+    # а не из метаданных контейнера. Процессы ffmpeg разных форм работают параллельно.
+    encoders: Dict[str, _AlphaEncoder] = {}
+
+    def write_frame(shape: str, frame_index: int, image: np.ndarray) -> None:
+        encoder = encoders.get(shape)
+        if encoder is None:
+            height, width = image.shape[:2]
+            encoder = _start_alpha_encoder(shape, width, height, fps, source_path, targets[shape], container)
+            encoders[shape] = encoder
+        _write_alpha_frame(encoder, image)
+
+    session_locks = [threading.Lock() for _ in segmentations]
+    # Связанные методы берутся один раз, а не через цепочку атрибутов на каждом кадре.
+    segment_processes = [segmentation.process for segmentation in segmentations]
+    detect_faces = face_detection.process if face_detection is not None else None
+    box_filter = cv2.boxFilter
+
+    def segment_frame(slot: int, rgb: np.ndarray) -> np.ndarray:
+        if segment_processes:
+            slot %= len(segment_processes)
+            with session_locks[slot]:
+                return segment_processes[slot](rgb).segmentation_mask.astype(np.float32)
+        assert rembg_session is not None
+        if rembg_direct:
+            return rembg_direct_masks(rembg_session, [rgb])[0]
+        # Модель всё равно работает на сетке 320/1024, поэтому кадр заранее
+        # уменьшается до rembg_base_size по длинной стороне, а маска растягивается обратно.
+        height, width = rgb.shape[:2]
+        scale = rembg_base_size / max(height, width) if rembg_base_size > 0 else 1.0
+        source = rgb
+        if scale < 1.0:
+            small_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            source = cv2.resize(rgb, small_size, interpolation=cv2.INTER_AREA)
+        mask_image = remove(
+            Image.fromarray(source),
+            session=rembg_session,
+            only_mask=True,
+            alpha_matting=rembg_alpha_matting,
+            alpha_matting_foreground_threshold=rembg_fg_threshold,
+            alpha_matting_background_threshold=rembg_bg_threshold,
+            alpha_matting_erode_structure_size=rembg_erode_size,
+            alpha_matting_base_size=rembg_base_size,
+        )
+        mask = np.asarray(mask_image, dtype=np.float32) / 255.0
+        if source is not rgb:
+            mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_LINEAR)
+        return mask
+
+    # Пачка кадров сегментируется параллельно на нескольких сессиях mediapipe
+    # (инференс TFLite отпускает GIL). rembg/onnxruntime и так многопоточен внутри,
+    # а u2net напрямую получает пачку одним тензором (выгодно на GPU).
+    batch_size = SEGMENTATION_BATCH if len(segmentations) > 1 or rembg_direct else 1
+    segmentation_pool = (
+        ThreadPoolExecutor(max_workers=len(segmentations), thread_name_prefix="overlay-segment")
+        if len(segmentations) > 1
+        else None
+    )
+
+    skip_limit = max(static_skip_threshold, 0.0) * STATIC_GATE_SIZE[0] * STATIC_GATE_SIZE[1]
+
+    # Три стадии: чтение кадров, сегментация и доработка маски (основной поток
+    # плюс пул сессий) и отправка кадров в ffmpeg. Очереди ограничены, так что
+    # декодирование следующих кадров и запись предыдущих идут во время инференса.
+    stop = threading.Event()
+    stage_errors: List[BaseException] = []
+    read_q: "queue.Queue[Any]" = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    write_q: "queue.Queue[Any]" = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    decoder = _RgbDecoder(source_path, frame_width, frame_height)
+    reader = threading.Thread(
+        target=_frame_reader,
+        args=(decoder, read_q, stop, stage_errors, skip_limit > 0),
+        name="overlay-reader",
+        daemon=True,
+    )
+    writer = threading.Thread(
+        target=_frame_writer, args=(write_q, write_frame, stop, stage_errors), name="overlay-writer", daemon=True
+    )
+    reader.start()
+    writer.start()
+
+    reference_small: Optional[np.ndarray] = None
+    previous_mask: Optional[np.ndarray] = None
+    reused_run = 0
+    skipped_frames = 0
+
+    try:
+        end_of_stream = False
+        while not end_of_stream and not stop.is_set():
+            batch, end_of_stream = _next_frame_batch(read_q, stop, batch_size)
+            if not batch:
+                break
+            # Гейтинг: кадр, почти не отличающийся от последнего сегментированного,
+            # берёт его маску. Не реже раза в STATIC_SKIP_REFRESH кадров маска обновляется.
+            infer_positions: List[int] = []
+            for position, (_, small) in enumerate(batch):
+                if (
+                    skip_limit <= 0
+                    or reference_small is None
+                    or reused_run >= STATIC_SKIP_REFRESH
+                    or cv2.norm(small, reference_small, cv2.NORM_L1) >= skip_limit
+                ):
+                    infer_positions.append(position)
+                    reference_small = small
+                    reused_run = 0
                 else:
-                    smooth = 0.2
-                    running_cx = running_cx * (1 - smooth) + cx_frame * smooth
-                    running_cy = running_cy * (1 - smooth) + cy_frame * smooth
-                    running_radius = running_radius * (1 - smooth) + radius_px_frame * smooth
-
-                cx = float(np.clip(running_cx, 0.0, w - 1))
-                cy = float(np.clip(running_cy, 0.0, h - 1))
-                radius = float(np.clip(running_radius, min_dim * 0.18, min_dim * 0.65))
+                    reused_run += 1
+            infer_rgbs = [batch[position][0] for position in infer_positions]
+            if segmentation_pool is not None and len(infer_rgbs) > 1:
+                # Кадры раскладываются по сессиям по кругу; map сохраняет порядок.
+                inferred = list(segmentation_pool.map(segment_frame, range(len(infer_rgbs)), infer_rgbs))
+            elif rembg_direct and infer_rgbs:
+                inferred = rembg_direct_masks(rembg_session, infer_rgbs)
             else:
-                radius = max(0.0, min(1.0, circle_radius)) * min_dim
-            cx = np.clip(circle_center_x, 0.0, 1.0) * (w - 1)
-            cy = np.clip(circle_center_y, 0.0, 1.0) * (h - 1)
+                inferred = [segment_frame(0, rgb) for rgb in infer_rgbs]
+            inferred_by_position = dict(zip(infer_positions, inferred))
+            masks: List[np.ndarray] = []
+            for position in range(len(batch)):
+                previous_mask = inferred_by_position.get(position, previous_mask)
+                masks.append(previous_mask)
+            skipped_frames += len(batch) - len(infer_positions)
+            for (rgb, _), mask in zip(batch, masks):
+                if stop.is_set():
+                    break
+                np.clip(mask, 0.0, 1.0, out=mask)
+                if buffers is None or buffers.alpha_full.shape != mask.shape:
+                    buffers = _FrameBuffers.allocate(mask.shape, mask_work_shape(mask.shape, mask_scale), targets)
+
+                if detect_faces is not None and index % face_detect_stride == 0:
+                    face_params = None
+                    detection_result = detect_faces(rgb)
+                    if detection_result and detection_result.detections:
+                        bbox = detection_result.detections[0].location_data.relative_bounding_box
+                        x_min = max(0.0, bbox.xmin)
+                        y_min = max(0.0, bbox.ymin)
+                        box_width = max(0.0, bbox.width)
+                        box_height = max(0.0, bbox.height)
+                        if box_width > 0 and box_height > 0:
+                            cx_face = (x_min + box_width * 0.5) * (w := mask.shape[1])
+                            cy_face = (y_min + box_height * 0.5) * (h := mask.shape[0])
+                            radius_face = max(box_width, box_height) * min(h, w) * (0.55 * 2.5)
+                            face_params = (cx_face, cy_face, radius_face)
+
+                # Порог, морфология и центроид — на уменьшенной маске: модели сегментации
+                # отдают маску 256-320 px, так что полное разрешение не добавляет деталей.
+                weights = mask
+                if buffers.mask_small.shape != mask.shape:
+                    weights = cv2.resize(
+                        mask, buffers.mask_small.shape[::-1], dst=buffers.mask_small, interpolation=cv2.INTER_AREA
+                    )
+                # mask уже в [0, 1], бинарная маска — 0/1, так что произведение не требует clip.
+                alpha_float = refine_mask(weights, threshold, kernel, buffers, morphology)
+                base_alpha = alpha_to_u8(alpha_float, buffers)
+                if base_alpha.shape != mask.shape:
+                    base_alpha = cv2.resize(
+                        base_alpha, mask.shape[::-1], dst=buffers.alpha_full, interpolation=cv2.INTER_LINEAR
+                    )
+                if feather_box > 1:
+                    # Растушёвка: три box-фильтра по uint8 ≈ GaussianBlur(feather) по float32.
+                    for _ in range(3):
+                        box_filter(base_alpha, -1, (feather_box, feather_box), dst=base_alpha)
+                for target_shape in targets:
+                    alpha = base_alpha
+                    if target_shape == "circle":
+                        h, w = alpha.shape
+                        min_dim = float(min(w, h))
+                        if circle_auto_center:
+                            if face_params is not None:
+                                cx_frame, cy_frame, radius_px_frame = face_params
+                            else:
+                                total_weight, weighted_x, weighted_y, x_min, x_max, y_min, y_max = centroid_and_bbox(weights)
+                                # Координаты уменьшенной маски переводятся в пиксели кадра.
+                                scale_x = w / weights.shape[1]
+                                scale_y = h / weights.shape[0]
+                                if total_weight > 0.0:
+                                    cx_frame = weighted_x / total_weight * scale_x
+                                    cy_frame = weighted_y / total_weight * scale_y
+                                    if x_max >= 0:
+                                        width_span = float(x_max - x_min) * scale_x
+                                        height_span = float(y_max - y_min) * scale_y
+                                        radius_px_frame = min(width_span, height_span) * 0.5
+                                    else:
+                                        radius_px_frame = min_dim * max(circle_radius, 0.25)
+                                else:
+                                    cx_frame = np.clip(circle_center_x, 0.0, 1.0) * (w - 1)
+                                    cy_frame = np.clip(circle_center_y, 0.0, 1.0) * (h - 1)
+                                    radius_px_frame = min_dim * max(circle_radius, 0.25)
 
-            yy, xx = np.ogrid[:h, :w]
-            circle_mask = ((xx - cx) ** 2 + (yy - cy) ** 2) <= radius ** 2
-            alpha_float = alpha_float * circle_mask.astype(np.float32)
+                            observed = np.array((cx_frame, cy_frame, radius_px_frame), dtype=np.float32)
+                            if circle_state is None:
+                                circle_state = observed
+                            else:
+                                smooth = np.float32(0.2)
+                                circle_state = circle_state * (1 - smooth) + observed * smooth
+
+                            lower = np.array((0.0, 0.0, min_dim * 0.18), dtype=np.float32)
+                            upper = np.array((w - 1, h - 1, min_dim * 0.65), dtype=np.float32)
+                            cx, cy, radius = np.clip(circle_state, lower, upper).tolist()
+                        else:
+                            radius = max(0.0, min(1.0, circle_radius)) * min_dim
+                        cx = np.clip(circle_center_x, 0.0, 1.0) * (w - 1)
+                        cy = np.clip(circle_center_y, 0.0, 1.0) * (h - 1)
 
-        alpha = np.clip(alpha_float * 255.0, 0, 255).astype(np.uint8)
+                        # Круг растеризует cv2.circle с антиалиасингом и субпиксельным
+                        # центром (CIRCLE_SHIFT бит дробной части): край мягкий без растушёвки.
+                        # Ключ — уже квантованные координаты: дрожание сглаженного круга
+                        # меньше 1/CIRCLE_SUBPIXEL пикселя не перерисовывает маску.
+                        center = (round(cx * CIRCLE_SUBPIXEL), round(cy * CIRCLE_SUBPIXEL))
+                        radius_fixed = round(radius * CIRCLE_SUBPIXEL)
+                        key = (h, w, center[0], center[1], radius_fixed)
+                        circle_mask = buffers.circle_mask
+                        if key != circle_key:
+                            circle_mask.fill(0)
+                            cv2.circle(circle_mask, center, radius_fixed, 255, -1, cv2.LINE_AA, CIRCLE_SHIFT)
+                            circle_key = key
+                        alpha = cv2.multiply(base_alpha, circle_mask, dst=buffers.circle_alpha, scale=1.0 / 255.0)
 
-        if debug and index == 0:
-            print("Mask stats min/max/mean:", float(mask.min()), float(mask.max()), float(mask.mean()))
-            print("Foreground coverage:", float((alpha > 0).mean()))
+                    if debug and index == 0:
+                        print("Mask stats min/max/mean:", float(mask.min()), float(mask.max()), float(mask.mean()))
+                        print("Foreground coverage:", float((alpha > 0).mean()))
 
-        foreground = (frame.astype(np.float32) * alpha_float[..., None]).astype(np.uint8)
-        foreground_bgra = cv2.cvtColor(foreground, cv2.COLOR_BGR2BGRA)
-        foreground_bgra[:, :, 3] = alpha
+                    # Прямая (не премультиплицированная) альфа — её и ждут yuva-форматы
+                    # vp9/prores: цвет кадра копируется как есть, альфа пишется в канал 3.
+                    foreground_bgra = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGRA, dst=buffers.next_bgra(target_shape))
+                    foreground_bgra[:, :, 3] = alpha
 
-        out_path = frames_dir / f"frame_{index:04d}.png"
-        cv2.imwrite(str(out_path), foreground_bgra)
-        index += 1
+                    if not _queue_put(write_q, (target_shape, index, foreground_bgra), stop):
+                        break
+                index += 1
         
-        # Логирование прогресса каждые 10%
-        if total_frames > 0:
-            progress_percent = int((index / total_frames) * 100)
-            # Логируем каждые 10% или раз в 5 секунд
-            current_time = time.time()
-            if (progress_percent >= last_logged_percent + 10 or 
-                current_time - last_progress_time >= 5):
-                elapsed = current_time - frame_start_time
-                fps_actual = index / elapsed if elapsed > 0 else 0
-                eta_seconds = (total_frames - index) / fps_actual if fps_actual > 0 else 0
-                logger.info(f"[PREPARE_OVERLAY] 📊 Progress: {progress_percent}% ({index}/{total_frames} frames, {fps_actual:.1f} fps, ETA: {eta_seconds:.0f}s)")
-                last_logged_percent = progress_percent
-                last_progress_time = current_time
-
-    if segmentation is not None:
-        segmentation.close()
-    if face_detection is not None:
-        face_detection.close()
-    cap.release()
+                # Логирование прогресса каждые 10%
+                if total_frames > 0:
+                    progress_percent = int((index / total_frames) * 100)
+                    # Логируем каждые 10% или раз в 5 секунд
+                    current_time = time.time()
+                    if (progress_percent >= last_logged_percent + 10 or 
+                        current_time - last_progress_time >= 5):
+                        elapsed = current_time - frame_start_time
+                        fps_actual = index / elapsed if elapsed > 0 else 0
+                        eta_seconds = (total_frames - index) / fps_actual if fps_actual > 0 else 0
+                        logger.info(f"[PREPARE_OVERLAY] 📊 Progress: {progress_percent}% ({index}/{total_frames} frames, {fps_actual:.1f} fps, ETA: {eta_seconds:.0f}s)")
+                        last_logged_percent = progress_percent
+                        last_progress_time = current_time
+
+    except BaseException:
+        stop.set()
+        writer.join()
+        for encoder in encoders.values():
+            _abort_alpha_encoder(encoder)
+        raise
+    finally:
+        _queue_put(write_q, _END_OF_STREAM, stop)
+        writer.join()
+        stop.set()
+        reader.join()
+        if segmentation_pool is not None:
+            segmentation_pool.shutdown()
+        for segmentation in segmentations:
+            segmentation.close()
+        if face_detection is not None:
+            face_detection.close()
+        decoder.release()
 
-    if index == 0:
+    if stage_errors or index == 0:
+        for encoder in encoders.values():
+            _abort_alpha_encoder(encoder)
+        if stage_errors:
+            raise stage_errors[0]
         raise RuntimeError("No frames extracted from source video.")
     
     frames_duration = time.time() - frame_start_time
     logger.info(f"[PREPARE_OVERLAY] ⏱️ Processed {index} frames in {frames_duration:.2f}s ({index/frames_duration:.1f} fps)")
+    if skipped_frames:
+        logger.info(f"[PREPARE_OVERLAY] 📊 Segmentation reused on {skipped_frames}/{index} near-static frames")
 
-    # Extract audio using ffmpeg (copy codec if possible)
-    logger.info(f"[PREPARE_OVERLAY] ▶️ Extracting audio")
-    audio_start = time.time()
-    run_ffmpeg(["-i", str(source_path), "-vn", "-acodec", "copy", str(audio_path)])
-    logger.info(f"[PREPARE_OVERLAY] ⏱️ Audio extracted in {time.time() - audio_start:.2f}s")
-
-    frame_pattern = str(frames_dir / "frame_%04d.png")
-    logger.info(f"[PREPARE_OVERLAY] ▶️ Encoding alpha video ({container})")
-    encode_start = time.time()
-    
-    if container == "webm":
-        encode_args = [
-            "-framerate",
-            f"{fps}",
-            "-i",
-            frame_pattern,
-            "-i",
-            str(audio_path),
-            "-c:v",
-            "libvpx-vp9",
-            "-pix_fmt",
-            "yuva420p",
-            "-auto-alt-ref",
-            "0",
-            "-c:a",
-            "libopus",
-            "-b:a",
-            "128k",
-            str(alpha_video_path),
-        ]
-    else:
-        encode_args = [
-            "-framerate",
-            f"{fps}",
-            "-i",
-            frame_pattern,
-            "-i",
-            str(audio_path),
-            "-c:v",
-            "prores_ks",
-            "-profile:v",
-            "4444",
-            "-pix_fmt",
-            "yuva444p10le",
-            "-c:a",
-            "aac",
-            "-b:a",
-            "192k",
-            "-movflags",
-            "+faststart",
-            str(alpha_video_path),
-        ]
-
-    run_ffmpeg(encode_args)
-    
-    encode_duration = time.time() - encode_start
-    logger.info(f"[PREPARE_OVERLAY] ⏱️ Video encoded in {encode_duration:.2f}s")
-    
-    output_size = alpha_video_path.stat().st_size
-    size_mb = output_size / (1024 * 1024)
-    logger.info(f"[PREPARE_OVERLAY] 📊 Output size: {size_mb:.1f}MB")
+    try:
+        for encoder in encoders.values():
+            _finish_alpha_encoder(encoder)
+    except BaseException:
+        for encoder in encoders.values():
+            if encoder.process.poll() is None:
+                _abort_alpha_encoder(encoder)
+        raise
 
     duration = index / fps
     return duration
 
 
+def build_alpha_clip(
+    source_path: Path,
+    alpha_video_path: Path,
+    container: str,
+    threshold: float,
+    feather: int,
+    debug: bool,
+    engine: str,
+    rembg_model: str,
+    rembg_alpha_matting: bool,
+    rembg_fg_threshold: int,
+    rembg_bg_threshold: int,
+    rembg_erode_size: int,
+    rembg_base_size: int,
+    shape: str,
+    circle_radius: float,
+    circle_center_x: float,
+    circle_center_y: float,
+    circle_auto_center: bool,
+    static_skip_threshold: float = STATIC_SKIP_THRESHOLD,
+    face_detect_stride: int = FACE_DETECT_STRIDE,
+    mask_scale: float = MASK_SCALE,
+    mask_morphology: bool = False,
+) -> float:
+    return build_alpha_clips(
+        source_path,
+        {shape: alpha_video_path},
+        container,
+        threshold,
+        feather,
+        debug,
+        engine,
+        rembg_model,
+        rembg_alpha_matting,
+        rembg_fg_threshold,
+        rembg_bg_threshold,
+        rembg_erode_size,
+        rembg_base_size,
+        circle_radius,
+        circle_center_x,
+        circle_center_y,
+        circle_auto_center,
+        static_skip_threshold,
+        face_detect_stride,
+        mask_scale,
+        mask_morphology,
+    )
+
+
 def request_signed_upload(api_key: str, stage: str) -> Tuple[str, str]:
     start_time = time.time()
     logger.info(f"[PREPARE_OVERLAY] ▶️ Requesting Shotstack signed upload URL")
     
     url = f"https://api.shotstack.io/ingest/{stage}/upload"
-    response = requests.post(url, headers={"x-api-key": api_key}, timeout=30)
+    response = http_session().post(url, headers={"x-api-key": api_key}, timeout=30)
     response.raise_for_status()
     data = response.json()["data"]
     
@@ -364,6 +1249,32 @@ def request_signed_upload(api_key: str, stage: str) -> Tuple[str, str]:
     return data["id"], data["attributes"]["url"]
 
 
+UPLOAD_BLOCK_BYTES = 1024 * 1024
+# Параметр пула blocksize появился только в urllib3 2.x; на 1.26 его ключ
+# ломает PoolKey, поэтому там остаётся блок по умолчанию.
+_POOL_BLOCKSIZE_SUPPORTED = int(urllib3.__version__.split(".")[0]) >= 2
+
+
+class _UploadAdapter(HTTPAdapter):
+    """Адаптер с блоком отправки 1 МБ вместо 8-16 КБ по умолчанию у http.client (urllib3 2.x)."""
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        if _POOL_BLOCKSIZE_SUPPORTED:
+            kwargs.setdefault("blocksize", UPLOAD_BLOCK_BYTES)
+        super().init_poolmanager(*args, **kwargs)
+
+
+@lru_cache(maxsize=1)
+def _upload_session() -> requests.Session:
+    # Отдельная сессия только для PUT: крупный блок отправки нужен загрузке,
+    # а общая сессия остаётся на стандартном HTTPAdapter.
+    session = requests.Session()
+    adapter = _UploadAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def upload_to_signed_url(file_path: Path, signed_url: str) -> None:
     start_time = time.time()
     file_size = file_path.stat().st_size
@@ -371,8 +1282,15 @@ def upload_to_signed_url(file_path: Path, signed_url: str) -> None:
     
     logger.info(f"[PREPARE_OVERLAY] ▶️ Uploading {size_mb:.1f}MB to Shotstack")
     
+    # Явный Content-Length: тело уходит одним потоком без chunked-кодирования.
+    # Content-Type не задаётся — он не входит в подпись URL.
     with open(file_path, "rb") as handle:
-        resp = requests.put(signed_url, data=handle, timeout=300)
+        resp = _upload_session().put(
+            signed_url,
+            data=handle,
+            headers={"Content-Length": str(file_size)},
+            timeout=300,
+        )
     resp.raise_for_status()
     
     duration = time.time() - start_time
@@ -389,15 +1307,26 @@ def derive_public_url(signed_url: str, extension: str) -> Tuple[str, str]:
     return owner_id, f"{base}/source{extension}"
 
 
-def wait_for_asset(url: str, timeout: int = 300, delay: float = 5.0) -> None:
+ASSET_POLL_INITIAL_SECONDS = 0.5
+ASSET_POLL_BACKOFF = 1.5
+ASSET_POLL_MAX_SECONDS = 10.0
+# Доля случайного разброса интервала: формы, публикуемые параллельно,
+# не опрашивают Shotstack синхронно.
+ASSET_POLL_JITTER = 0.2
+
+
+def wait_for_asset(url: str, timeout: int = 300, delay: float = ASSET_POLL_INITIAL_SECONDS) -> None:
     logger.info(f"[PREPARE_OVERLAY] ▶️ Waiting for Shotstack to process asset")
-    start_time = time.time()
     elapsed = 0.0
     check_count = 0
-    
+    next_report = 30.0
+
+    # Интервал растёт от 0,5 с до 10 с: быстро готовые ассеты замечаются сразу,
+    # а HEAD-запросы идут по keep-alive соединению общей сессии.
+    session = http_session()
     while elapsed < timeout:
         try:
-            response = requests.head(url, timeout=10)
+            response = session.head(url, timeout=10)
             if response.status_code == 200:
                 logger.info(f"[PREPARE_OVERLAY] ⏱️ Asset ready in {elapsed:.2f}s (after {check_count} checks)")
                 return
@@ -406,17 +1335,35 @@ def wait_for_asset(url: str, timeout: int = 300, delay: float = 5.0) -> None:
         time.sleep(delay)
         elapsed += delay
         check_count += 1
-        
-        # Логируем каждые 30 секунд
-        if int(elapsed) % 30 == 0 and elapsed > 0:
+        jitter = random.uniform(1.0 - ASSET_POLL_JITTER, 1.0 + ASSET_POLL_JITTER)
+        delay = min(delay * ASSET_POLL_BACKOFF * jitter, ASSET_POLL_MAX_SECONDS)
+
+        # Логируем примерно каждые 30 секунд
+        if elapsed >= next_report:
             logger.info(f"[PREPARE_OVERLAY] 📊 Still waiting... ({elapsed:.0f}s elapsed)")
-    
+            next_report += 30.0
+
     raise TimeoutError(f"Asset was not accessible within {timeout} seconds: {url}")
 
 
-def prepare_overlay(
+def _publish_overlay(shape: str, output_path: Path, stage: str, api_key: str, container: str) -> str:
+    extension = output_path.suffix or (".webm" if container == "webm" else ".mov")
+
+    upload_id, signed_url = request_signed_upload(api_key, stage)
+    logger.info(f"[PREPARE_OVERLAY] 📊 Upload ID ({shape}): {upload_id}")
+
+    upload_to_signed_url(output_path, signed_url)
+
+    logger.info(f"[PREPARE_OVERLAY] ▶️ Deriving public asset URL")
+    _, public_url = derive_public_url(signed_url, extension)
+
+    wait_for_asset(public_url)
+    return public_url
+
+
+def prepare_overlays(
     input_url: str,
-    output_path: Path,
+    output_paths: Dict[str, Path],
     stage: str,
     api_key: str,
     container: str,
@@ -430,35 +1377,40 @@ def prepare_overlay(
     rembg_bg_threshold: int,
     rembg_erode_size: int,
     rembg_base_size: int,
-    shape: str,
     circle_radius: float,
     circle_center_x: float,
     circle_center_y: float,
     circle_auto_center: bool = True,
-) -> str:
+    static_skip_threshold: float = STATIC_SKIP_THRESHOLD,
+    face_detect_stride: int = FACE_DETECT_STRIDE,
+    mask_scale: float = MASK_SCALE,
+    mask_morphology: bool = False,
+) -> Dict[str, str]:
+    """
+    Подготовить оверлеи нескольких форм из одного исходника.
+
+    Исходник скачивается и сегментируется один раз; для каждой формы
+    кодируется и загружается в Shotstack свой файл. Возвращает shape -> URL.
+    """
     overall_start = time.time()
+    shapes = list(output_paths)
     logger.info(f"[PREPARE_OVERLAY] ▶️ Starting overlay preparation")
-    logger.info(f"[PREPARE_OVERLAY] 📊 Engine: {engine}, Shape: {shape}, Container: {container}")
-    
-    with tempfile.TemporaryDirectory() as tmpdir_str:
+    logger.info(f"[PREPARE_OVERLAY] 📊 Engine: {engine}, Shapes: {', '.join(shapes)}, Container: {container}")
+
+    with tempfile.TemporaryDirectory(dir=scratch_dir()) as tmpdir_str:
         tmpdir = Path(tmpdir_str)
         source_path = tmpdir / "input.mp4"
-        frames_dir = tmpdir / "frames"
-        frames_dir.mkdir()
-        audio_path = tmpdir / "audio.m4a"
 
         logger.info(f"[PREPARE_OVERLAY] ▶️ Downloading source clip")
         download_start = time.time()
-        download_file(input_url, source_path)
+        parallel_download(input_url, source_path)
         logger.info(f"[PREPARE_OVERLAY] ⏱️ Download completed in {time.time() - download_start:.2f}s")
 
-        logger.info(f"[PREPARE_OVERLAY] ▶️ Building alpha-matted clip")
+        logger.info(f"[PREPARE_OVERLAY] ▶️ Building alpha-matted clips")
         alpha_start = time.time()
-        duration = build_alpha_clip(
+        duration = build_alpha_clips(
             source_path,
-            frames_dir,
-            audio_path,
-            output_path,
+            output_paths,
             container,
             threshold,
             feather,
@@ -470,38 +1422,92 @@ def prepare_overlay(
             rembg_bg_threshold,
             rembg_erode_size,
             rembg_base_size,
-            shape,
             circle_radius,
             circle_center_x,
             circle_center_y,
             circle_auto_center,
+            static_skip_threshold,
+            face_detect_stride,
+            mask_scale,
+            mask_morphology,
         )
         alpha_duration = time.time() - alpha_start
-        logger.info(f"[PREPARE_OVERLAY] ⏱️ Alpha clip built in {alpha_duration:.2f}s")
-        
-        extension = output_path.suffix or (".webm" if container == "webm" else ".mov")
-
-        upload_id, signed_url = request_signed_upload(api_key, stage)
-        logger.info(f"[PREPARE_OVERLAY] 📊 Upload ID: {upload_id}")
-
-        upload_to_signed_url(output_path, signed_url)
-
-        logger.info(f"[PREPARE_OVERLAY] ▶️ Deriving public asset URL")
-        _, public_url = derive_public_url(signed_url, extension)
+        logger.info(f"[PREPARE_OVERLAY] ⏱️ Alpha clips built in {alpha_duration:.2f}s")
 
-        wait_for_asset(public_url)
+        # Загрузка и ожидание обработки в Shotstack — чистый I/O, формы не зависят друг от друга.
+        with ThreadPoolExecutor(max_workers=len(output_paths)) as executor:
+            futures = {
+                shape: executor.submit(_publish_overlay, shape, output_path, stage, api_key, container)
+                for shape, output_path in output_paths.items()
+            }
+            public_urls = {shape: future.result() for shape, future in futures.items()}
+        for shape, public_url in public_urls.items():
+            logger.info(f"[PREPARE_OVERLAY] ✅ Overlay {shape} ready at {public_url} (duration {duration:.2f}s)")
 
         overall_duration = time.time() - overall_start
         minutes = int(overall_duration // 60)
         seconds = overall_duration % 60
-        
+
         if overall_duration > 60:
             logger.info(f"[PREPARE_OVERLAY] ⏱️ Total overlay generation: {overall_duration:.2f}s ({minutes}m {seconds:.1f}s) ⚠️")
         else:
             logger.info(f"[PREPARE_OVERLAY] ⏱️ Total overlay generation: {overall_duration:.2f}s")
-        
-        logger.info(f"[PREPARE_OVERLAY] ✅ Overlay ready at {public_url} (duration {duration:.2f}s)")
-        return public_url
+
+        return public_urls
+
+
+def prepare_overlay(
+    input_url: str,
+    output_path: Path,
+    stage: str,
+    api_key: str,
+    container: str,
+    threshold: float,
+    feather: int,
+    debug: bool,
+    engine: str,
+    rembg_model: str,
+    rembg_alpha_matting: bool,
+    rembg_fg_threshold: int,
+    rembg_bg_threshold: int,
+    rembg_erode_size: int,
+    rembg_base_size: int,
+    shape: str,
+    circle_radius: float,
+    circle_center_x: float,
+    circle_center_y: float,
+    circle_auto_center: bool = True,
+    static_skip_threshold: float = STATIC_SKIP_THRESHOLD,
+    face_detect_stride: int = FACE_DETECT_STRIDE,
+    mask_scale: float = MASK_SCALE,
+    mask_morphology: bool = False,
+) -> str:
+    urls = prepare_overlays(
+        input_url,
+        {shape: output_path},
+        stage,
+        api_key,
+        container,
+        threshold=threshold,
+        feather=feather,
+        debug=debug,
+        engine=engine,
+        rembg_model=rembg_model,
+        rembg_alpha_matting=rembg_alpha_matting,
+        rembg_fg_threshold=rembg_fg_threshold,
+        rembg_bg_threshold=rembg_bg_threshold,
+        rembg_erode_size=rembg_erode_size,
+        rembg_base_size=rembg_base_size,
+        circle_radius=circle_radius,
+        circle_center_x=circle_center_x,
+        circle_center_y=circle_center_y,
+        circle_auto_center=circle_auto_center,
+        static_skip_threshold=static_skip_threshold,
+        face_detect_stride=face_detect_stride,
+        mask_scale=mask_scale,
+        mask_morphology=mask_morphology,
+    )
+    return urls[shape]
 
 
 def parse_args() -> argparse.Namespace:
@@ -612,6 +1618,32 @@ def parse_args() -> argparse.Namespace:
         help="Отключить автоматическое определение центра круга по маске (по умолчанию включено).",
     )
     parser.set_defaults(circle_auto_center=True)
+    parser.add_argument(
+        "--static-skip-threshold",
+        type=float,
+        default=STATIC_SKIP_THRESHOLD,
+        help=(
+            "Reuse the previous mask when the mean grayscale difference of a 64x64 thumbnail "
+            f"is below this value (0-255, 0 disables, default: {STATIC_SKIP_THRESHOLD})."
+        ),
+    )
+    parser.add_argument(
+        "--face-detect-stride",
+        type=int,
+        default=FACE_DETECT_STRIDE,
+        help=f"Run face detection for circle auto-centering every N frames (default: {FACE_DETECT_STRIDE}).",
+    )
+    parser.add_argument(
+        "--mask-scale",
+        type=float,
+        default=MASK_SCALE,
+        help=f"Scale of the mask used for thresholding and morphology relative to the frame (default: {MASK_SCALE}).",
+    )
+    parser.add_argument(
+        "--mask-morphology",
+        action="store_true",
+        help="Apply close/open cleanup to mediapipe masks too (always applied for rembg).",
+    )
     return parser.parse_args()
 
 
@@ -652,6 +1684,10 @@ def main() -> None:
             circle_center_x=args.circle_center_x,
             circle_center_y=args.circle_center_y,
             circle_auto_center=args.circle_auto_center,
+            static_skip_threshold=args.static_skip_threshold,
+            face_detect_stride=args.face_detect_stride,
+            mask_scale=args.mask_scale,
+            mask_morphology=args.mask_morphology,
         )
     except Exception as exc:
         print(f"Error: {exc}", file=sys.stderr)
@@ -1,6 +1,7 @@
 from .client import (
     DEFAULT_HOST,
     DEFAULT_STAGE,
+    POLL_MAX_SECONDS,
     POLL_SECONDS,
     POLL_TIMEOUT,
     ShotstackError,
@@ -14,15 +15,20 @@ from .client import (
     build_video_clip,
     extract_result,
     load_spec,
+    poll_jobs,
     poll_render,
     probe_duration,
+    probe_durations,
     render_from_spec,
+    render_from_specs_batch,
     submit_render,
+    submit_spec,
 )
 
 __all__ = [
     "DEFAULT_HOST",
     "DEFAULT_STAGE",
+    "POLL_MAX_SECONDS",
     "POLL_SECONDS",
     "POLL_TIMEOUT",
     "ShotstackError",
@@ -36,8 +42,12 @@ __all__ = [
     "build_video_clip",
     "extract_result",
     "load_spec",
+    "poll_jobs",
     "poll_render",
     "probe_duration",
+    "probe_durations",
     "render_from_spec",
+    "render_from_specs_batch",
     "submit_render",
+    "submit_spec",
 ]
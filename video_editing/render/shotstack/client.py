@@ -1,18 +1,22 @@
 from __future__ import annotations
 
-import json
 import os
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
 from html import escape
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 from urllib import error, request
 
+from common import jsonio
+
 
 DEFAULT_STAGE = os.getenv("SHOTSTACK_STAGE", "stage")
 DEFAULT_HOST = os.getenv("SHOTSTACK_API_HOST", "https://api.shotstack.io")
 POLL_SECONDS = int(os.getenv("SHOTSTACK_POLL_SECONDS", "5"))
 POLL_TIMEOUT = int(os.getenv("SHOTSTACK_POLL_TIMEOUT", "300"))
+POLL_MAX_SECONDS = int(os.getenv("SHOTSTACK_POLL_MAX_SECONDS", "20"))
+POLL_BACKOFF = 1.5
 
 SUBTITLE_THEME_DEFAULT = "light"
 SUBTITLE_THEME_STYLES: Dict[str, Dict[str, str]] = {
@@ -54,8 +58,7 @@ class ShotstackError(RuntimeError):
 
 
 def load_spec(path: str) -> Dict[str, Any]:
-    with open(path, encoding="utf-8") as handle:
-        return json.load(handle)
+    return jsonio.read_json(path)
 
 
 def _is_video_clip(clip: Dict[str, Any]) -> bool:
@@ -98,6 +101,16 @@ def probe_duration(src: str) -> float:
         raise ShotstackError(f"Unable to parse duration for {src}: {output}") from exc
 
 
+def probe_durations(srcs: List[str], max_workers: Optional[int] = None) -> Dict[str, float]:
+    """Probe several sources concurrently; ffprobe handles one input per process."""
+    unique = list(dict.fromkeys(srcs))
+    if len(unique) <= 1:
+        return {src: probe_duration(src) for src in unique}
+    workers = max_workers or min(len(unique), os.cpu_count() or 4)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(unique, pool.map(probe_duration, unique)))
+
+
 def _collect_clips(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
     clips: List[Dict[str, Any]] = []
     clips.extend(spec.get("clips", []))
@@ -133,14 +146,23 @@ def apply_automation(spec: Dict[str, Any]) -> None:
         if match_label:
             match_targets.add(match_label)
 
-    for clip in clips:
-        needs_duration = bool(
+    def needs_duration(clip: Dict[str, Any]) -> bool:
+        return bool(
             clip.get("auto_length")
             or clip.get("length") is None
             or clip.get("match_length_to")
             or (clip.get("label") in match_targets and clip.get("length") is None)
         )
-        duration = resolve_duration(clip) if needs_duration else None
+
+    pending = [
+        clip["src"]
+        for clip in clips
+        if clip.get("src") and _is_video_clip(clip) and needs_duration(clip)
+    ]
+    duration_cache.update(probe_durations(pending))
+
+    for clip in clips:
+        duration = resolve_duration(clip) if needs_duration(clip) else None
         trim_seconds = _trim_seconds(clip)
         playable_duration = None
         if duration is not None:
@@ -396,14 +418,13 @@ def api_request(
     data: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     headers = {"x-api-key": api_key, "Content-Type": "application/json"}
-    body = json.dumps(data).encode("utf-8") if data is not None else None
+    body = jsonio.dumps(data) if data is not None else None
 
     req = request.Request(url, data=body, headers=headers, method=method)
 
     try:
         with request.urlopen(req) as response:
-            payload = response.read().decode("utf-8")
-            return json.loads(payload)
+            return jsonio.loads(response.read())
     except error.HTTPError as exc:
         details = exc.read().decode("utf-8")
         raise ShotstackError(f"Shotstack API request failed ({exc.code}): {details}") from exc
@@ -455,6 +476,57 @@ def poll_render(render_id: str, api_key: str, host: str, stage: str, wait: bool
         time.sleep(POLL_SECONDS)
 
 
+def poll_jobs(
+    render_ids: Sequence[str],
+    api_key: str,
+    host: str,
+    stage: str,
+    wait: bool = True,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Poll several renders from one loop and yield (render_id, response) as each finishes.
+
+    Every round checks all pending ids once; the pause between rounds grows from
+    POLL_SECONDS up to POLL_MAX_SECONDS, so long renders cost fewer API calls.
+
+    POLL_TIMEOUT applies to each render separately, counted from the moment it
+    leaves the "queued" state (or from the start of polling while it is still
+    queued), so a large batch does not share one deadline.
+    """
+    pending = list(dict.fromkeys(render_ids))
+    base_url = f"{host.rstrip('/')}/{stage}/render"
+    started = time.time()
+    delay = float(POLL_SECONDS)
+    last_status: Dict[str, Optional[str]] = {}
+    job_started: Dict[str, float] = {render_id: started for render_id in pending}
+    print(f"[ASSEMBLE] ▶️ Polling {len(pending)} renders")
+
+    while pending:
+        still_pending: List[str] = []
+        for render_id in pending:
+            response = api_request("GET", f"{base_url}/{render_id}", api_key)
+            status = response.get("response", {}).get("status")
+            if status != last_status.get(render_id):
+                now = time.time()
+                print(f"[ASSEMBLE] 📊 {render_id}: {status} ({now - started:.0f}s elapsed)")
+                if last_status.get(render_id, "queued") == "queued" and status != "queued":
+                    job_started[render_id] = now
+                last_status[render_id] = status
+            if status in {"done", "failed", "cancelled"} or not wait:
+                yield render_id, response
+            else:
+                still_pending.append(render_id)
+        pending = still_pending
+        if not pending:
+            return
+        now = time.time()
+        expired = [render_id for render_id in pending if now - job_started[render_id] > POLL_TIMEOUT]
+        if expired:
+            raise ShotstackError(f"Polling timeout after {POLL_TIMEOUT} seconds: {', '.join(expired)}")
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, float(POLL_MAX_SECONDS))
+
+
 def extract_result(response: Dict[str, Any]) -> Dict[str, Any]:
     result = response.get("response", {})
     status = result.get("status")
@@ -479,20 +551,56 @@ def extract_result(response: Dict[str, Any]) -> Dict[str, Any]:
     return output
 
 
-def render_from_spec(path: str, wait: bool = True) -> Dict[str, Any]:
-    overall_start = time.time()
-    print(f"[ASSEMBLE] ▶️ Starting render from spec: {path}")
-
+def _render_credentials() -> Tuple[str, str, str]:
     api_key = os.getenv("SHOTSTACK_API_KEY")
     if not api_key:
         raise ShotstackError("Environment variable SHOTSTACK_API_KEY must be set.")
-
     stage = os.getenv("SHOTSTACK_STAGE", DEFAULT_STAGE)
     host = os.getenv("SHOTSTACK_API_HOST", DEFAULT_HOST)
+    return api_key, host, stage
 
+
+def submit_spec(path: str, api_key: str, host: str, stage: str) -> str:
     spec = load_spec(path)
     payload = build_render_payload(spec)
-    render_id = submit_render(payload, api_key, host, stage)
+    return submit_render(payload, api_key, host, stage)
+
+
+def render_from_specs_batch(
+    paths: Sequence[str],
+    wait: bool = True,
+    max_workers: Optional[int] = None,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Render several specs as one batch and yield (path, result) as renders finish.
+
+    Shotstack has no multi-render endpoint, so the batch is client-side: every
+    spec is built and submitted up front so all jobs queue on the server at
+    once, then all render ids are polled from a single loop (poll_jobs).
+    """
+    paths = list(paths)
+    if not paths:
+        return
+    api_key, host, stage = _render_credentials()
+    workers = max_workers or len(paths)
+    print(f"[ASSEMBLE] ▶️ Submitting {len(paths)} renders")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        render_ids = list(pool.map(lambda path: submit_spec(path, api_key, host, stage), paths))
+    paths_by_id = dict(zip(render_ids, paths))
+    for render_id, poll_response in poll_jobs(render_ids, api_key, host, stage, wait):
+        path = paths_by_id[render_id]
+        if wait:
+            yield path, extract_result(poll_response)
+        else:
+            yield path, {"status": poll_response.get("response", {}).get("status"), "id": render_id}
+
+
+def render_from_spec(path: str, wait: bool = True) -> Dict[str, Any]:
+    overall_start = time.time()
+    print(f"[ASSEMBLE] ▶️ Starting render from spec: {path}")
+
+    api_key, host, stage = _render_credentials()
+    render_id = submit_spec(path, api_key, host, stage)
 
     poll_start = time.time()
     poll_response = poll_render(render_id, api_key, host, stage, wait=wait)
@@ -1,12 +1,18 @@
 from .subtitle_tools import (
+    SpeechAnalysis,
     align_transcript_to_segments,
+    analyze_speech,
+    build_speech_segments,
     detect_speech_segments,
     load_subtitles,
     read_transcript,
 )
 
 __all__ = [
+    "SpeechAnalysis",
     "align_transcript_to_segments",
+    "analyze_speech",
+    "build_speech_segments",
     "detect_speech_segments",
     "load_subtitles",
     "read_transcript",
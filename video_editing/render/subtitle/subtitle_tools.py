@@ -7,11 +7,22 @@ provide their own exception types via the ``error_cls`` parameter.
 """
 from __future__ import annotations
 
-import json
 import re
 import subprocess
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Type
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple, Type
+
+import numpy as np
+
+from common import jsonio
+
+_SILENCE_RE = re.compile(r"silence_(start|end):\s*(\S+)")
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+_VIDEO_STREAM_RE = re.compile(r"Stream #\d+:\d+.*?: Video:")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+_SENTENCE_FALLBACK_WORDS = 10
 
 
 def _error(exc: BaseException, error_cls: Type[Exception]) -> Exception:
@@ -28,9 +39,8 @@ def load_subtitles(
 ) -> List[Dict[str, object]]:
     """Load subtitles from JSON file into Shotstack-compatible structure."""
     try:
-        with open(path, encoding="utf-8") as handle:
-            data = json.load(handle)
-    except (OSError, json.JSONDecodeError) as exc:
+        data = jsonio.read_json(path)
+    except (OSError, jsonio.JSONDecodeError) as exc:
         raise error_cls(f"Не удалось прочитать субтитры из {path}: {exc}") from exc
 
     if isinstance(data, dict):
@@ -108,51 +118,99 @@ def read_transcript(
     return None
 
 
-def detect_speech_segments(
+class SpeechAnalysis(NamedTuple):
+    """Result of a single silencedetect pass over a media file."""
+
+    duration: Optional[float]
+    has_video: bool
+    silences: List[Tuple[str, float]]
+
+
+def _parse_header_duration(match: re.Match[str]) -> float:
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def analyze_speech(
     media_path: Path,
-    duration: float,
     *,
     error_cls: Type[Exception] = RuntimeError,
     silence_db: float = -35.0,
     min_silence_duration: float = 0.35,
-    min_segment_duration: float = 0.3,
-) -> List[Tuple[float, float]]:
-    """Detect speech segments via ffmpeg silencedetect."""
+) -> SpeechAnalysis:
+    """
+    Run ffmpeg silencedetect once and collect silence events.
+
+    The input header printed by ffmpeg in the same pass gives the container
+    duration and tells whether a video stream is present, so no separate
+    ffprobe call is needed. Video decoding is disabled with ``-vn``.
+    """
     command = [
         "ffmpeg",
         "-hide_banner",
         "-i",
         str(media_path),
+        "-vn",
         "-af",
         f"silencedetect=noise={silence_db}dB:d={min_silence_duration}",
         "-f",
         "null",
         "-",
     ]
-    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
-    if result.returncode != 0:
-        raise error_cls(f"ffmpeg silencedetect failed: {result.stderr.strip()}")
+    duration: Optional[float] = None
+    has_video = False
+    silences: List[Tuple[str, float]] = []
+    # Держим только хвост лога для сообщения об ошибке, а не весь stderr.
+    stderr_tail: Deque[str] = deque(maxlen=20)
+
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+    )
+    assert process.stderr is not None
+    with process:
+        for line in process.stderr:
+            stderr_tail.append(line)
+            match = _SILENCE_RE.search(line)
+            if match is not None:
+                try:
+                    silences.append((match.group(1), float(match.group(2))))
+                except ValueError:
+                    pass
+                continue
+            if duration is None:
+                duration_match = _DURATION_RE.search(line)
+                if duration_match is not None:
+                    duration = _parse_header_duration(duration_match)
+                    continue
+            if not has_video and _VIDEO_STREAM_RE.search(line) and "attached pic" not in line:
+                has_video = True
+
+    if process.returncode != 0:
+        raise error_cls(f"ffmpeg silencedetect failed: {''.join(stderr_tail).strip()}")
+
+    return SpeechAnalysis(duration=duration, has_video=has_video, silences=silences)
+
 
+def build_speech_segments(
+    silences: List[Tuple[str, float]],
+    duration: float,
+    *,
+    min_segment_duration: float = 0.3,
+) -> List[Tuple[float, float]]:
+    """Turn silencedetect events into (start, duration) speech segments."""
     current_start = 0.0
     speech_segments: List[Tuple[float, float]] = []
 
-    for line in result.stderr.splitlines():
-        line = line.strip()
-        if "silence_start" in line:
-            try:
-                silence_start = float(line.split("silence_start:")[1].split()[0])
-            except (IndexError, ValueError):
-                continue
-            segment_duration = silence_start - current_start
+    for kind, value in silences:
+        if kind == "start":
+            segment_duration = value - current_start
             if segment_duration >= min_segment_duration:
                 speech_segments.append((current_start, segment_duration))
-            current_start = silence_start
-        elif "silence_end" in line:
-            try:
-                silence_end = float(line.split("silence_end:")[1].split()[0])
-            except (IndexError, ValueError):
-                continue
-            current_start = silence_end
+        current_start = value
 
     if duration > current_start:
         tail_duration = duration - current_start
@@ -165,17 +223,46 @@ def detect_speech_segments(
     return speech_segments
 
 
-def sentence_tokenize(text: str) -> List[str]:
-    """Split transcript into sentence-like chunks."""
+def detect_speech_segments(
+    media_path: Path,
+    duration: float,
+    *,
+    error_cls: Type[Exception] = RuntimeError,
+    silence_db: float = -35.0,
+    min_silence_duration: float = 0.35,
+    min_segment_duration: float = 0.3,
+) -> List[Tuple[float, float]]:
+    """Detect speech segments via ffmpeg silencedetect."""
+    analysis = analyze_speech(
+        media_path,
+        error_cls=error_cls,
+        silence_db=silence_db,
+        min_silence_duration=min_silence_duration,
+    )
+    return build_speech_segments(
+        analysis.silences,
+        duration,
+        min_segment_duration=min_segment_duration,
+    )
+
+
+@lru_cache(maxsize=16)
+def _sentence_tokenize_cached(text: str) -> Tuple[str, ...]:
     stripped = text.strip()
     if not stripped:
-        return []
-    parts = [part.strip() for part in re.split(r"(?<=[.!?])\s+", stripped) if part.strip()]
+        return ()
+    parts = tuple(part for part in map(str.strip, _SENTENCE_SPLIT_RE.split(stripped)) if part)
     if parts:
         return parts
     words = stripped.split()
-    chunk_size = 10
-    return [" ".join(words[i : i + chunk_size]) for i in range(0, len(words), chunk_size)]
+    chunk_size = _SENTENCE_FALLBACK_WORDS
+    return tuple(" ".join(words[i : i + chunk_size]) for i in range(0, len(words), chunk_size))
+
+
+def sentence_tokenize(text: str) -> List[str]:
+    """Split transcript into sentence-like chunks."""
+    # Кеш хранит tuple, наружу отдаём новый список, чтобы вызывающий мог его менять.
+    return list(_sentence_tokenize_cached(text))
 
 
 def align_transcript_to_segments(
@@ -195,21 +282,17 @@ def align_transcript_to_segments(
     if total_segments_duration <= 0:
         total_segments_duration = total_duration or 1.0
 
-    allocations: List[List[str]] = []
-    sentence_index = 0
-    cumulative = 0.0
+    # Границы предложений по сегментам: round(накопленная доля * N), но каждый
+    # сегмент получает хотя бы одно предложение (n_i >= n_{i-1} + 1). Условие
+    # сводится к накопленному максимуму по (round_i - i), последний сегмент забирает остаток.
     num_sentences = len(sentences)
-
-    for seg_index, (_, duration) in enumerate(segments):
-        if seg_index == len(segments) - 1:
-            next_index = num_sentences
-        else:
-            portion = duration / total_segments_duration
-            cumulative += portion * num_sentences
-            next_index = max(sentence_index + 1, int(round(cumulative)))
-            next_index = min(next_index, num_sentences)
-        allocations.append(sentences[sentence_index:next_index])
-        sentence_index = next_index
+    durations = np.fromiter((duration for _, duration in segments), dtype=np.float64, count=len(segments))
+    rounded = np.round(np.cumsum(durations / total_segments_duration * num_sentences)).astype(np.int64)
+    positions = np.arange(1, len(segments) + 1)
+    bounds = np.minimum(np.maximum.accumulate(np.maximum(rounded - positions, 0)) + positions, num_sentences)
+    bounds[-1] = num_sentences
+    starts = [0, *bounds[:-1].tolist()]
+    allocations = [sentences[start:end] for start, end in zip(starts, bounds.tolist())]
 
     subtitles: List[Dict[str, object]] = []
     for (seg_start, seg_duration), texts in zip(segments, allocations):
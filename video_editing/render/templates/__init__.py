@@ -1,15 +1,19 @@
 from .spec_editor import (
+    compile_node_path,
     ensure_background,
     get_node,
     load_spec,
     save_spec,
+    update_clip,
     update_nodes,
 )
 
 __all__ = [
+    "compile_node_path",
     "ensure_background",
     "get_node",
     "load_spec",
     "save_spec",
+    "update_clip",
     "update_nodes",
 ]
@@ -1,33 +1,51 @@
 from __future__ import annotations
 
-import json
+import operator
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Iterable, Optional, Sequence, Type, Union
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple, Type, Union
 
+from common import jsonio
 
 PathLike = Union[str, Path]
 
 
 def load_spec(path: PathLike) -> Dict[str, Any]:
-    with open(path, encoding="utf-8") as handle:
-        return json.load(handle)
+    return jsonio.read_json(path)
 
 
 def save_spec(spec: Dict[str, Any], path: PathLike) -> None:
-    with open(path, "w", encoding="utf-8") as handle:
-        json.dump(spec, handle, indent=2, ensure_ascii=False)
+    jsonio.write_json(spec, path, indent=True)
 
 
 def ensure_background(spec: Dict[str, Any], color: str) -> None:
     spec["background"] = color
 
 
-def _get_node(
+@lru_cache(maxsize=None)
+def compile_node_path(path: Tuple[object, ...]) -> Callable[[Any], Any]:
+    """
+    Скомпилировать статический путь вида ("clips", 0) в цепочку itemgetter.
+    Пути шаблонов фиксированы, поэтому accessor строится один раз на путь.
+    """
+    if len(path) == 1:
+        return operator.itemgetter(path[0])
+    getters = tuple(operator.itemgetter(key) for key in path)
+
+    def accessor(node: Any) -> Any:
+        for getter in getters:
+            node = getter(node)
+        return node
+
+    return accessor
+
+
+def _walk_node(
     spec: Dict[str, Any],
     path: Sequence[object],
     *,
     error_cls: Type[Exception],
-) -> Dict[str, Any]:
+) -> object:
     node: object = spec
     for key in path:
         if isinstance(key, int):
@@ -40,6 +58,20 @@ def _get_node(
                 node = node[key]  # type: ignore[index]
             except (KeyError, TypeError) as exc:
                 raise error_cls(f"Ключ {key} не найден по пути {path}") from exc
+    return node
+
+
+def _get_node(
+    spec: Dict[str, Any],
+    path: Sequence[object],
+    *,
+    error_cls: Type[Exception],
+) -> Dict[str, Any]:
+    try:
+        node = compile_node_path(tuple(path))(spec)
+    except (KeyError, IndexError, TypeError):
+        # Медленный проход нужен только ради понятного сообщения об ошибке.
+        node = _walk_node(spec, path, error_cls=error_cls)
     if not isinstance(node, dict):
         raise error_cls(f"Ожидался объект dict по пути {path}, но получен {type(node).__name__}")
     return node
@@ -65,16 +97,33 @@ def update_nodes(
     length: Optional[float] = None,
 ) -> None:
     for path in paths:
-        clip = _get_node(spec, path, error_cls=error_cls)
-        clip["src"] = url
-        if fit_mode:
-            clip["fit"] = fit_mode
-        if asset_type:
-            clip["type"] = asset_type
-            if asset_type == "image":
-                clip.pop("trim", None)
-                clip.pop("auto_length", None)
-                clip.pop("match_length_to", None)
-                clip.pop("speed", None)
-        if length is not None:
-            clip["length"] = round(max(length, 0.1), 3)
+        update_clip(
+            _get_node(spec, path, error_cls=error_cls),
+            url,
+            fit_mode,
+            asset_type=asset_type,
+            length=length,
+        )
+
+
+def update_clip(
+    clip: Dict[str, Any],
+    url: str,
+    fit_mode: Optional[str] = None,
+    *,
+    asset_type: Optional[str] = None,
+    length: Optional[float] = None,
+) -> None:
+    """То же, что update_nodes, но для уже найденного узла — без повторного обхода спеки."""
+    clip["src"] = url
+    if fit_mode:
+        clip["fit"] = fit_mode
+    if asset_type:
+        clip["type"] = asset_type
+        if asset_type == "image":
+            clip.pop("trim", None)
+            clip.pop("auto_length", None)
+            clip.pop("match_length_to", None)
+            clip.pop("speed", None)
+    if length is not None:
+        clip["length"] = round(max(length, 0.1), 3)
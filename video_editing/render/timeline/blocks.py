@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import copy
-import json
-from typing import Any, Dict, Iterable, List, Optional, Type
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from common import jsonio
 
 
 def load_blocks_config(
@@ -13,41 +13,93 @@ def load_blocks_config(
     if not path:
         return {}
     try:
-        with open(path, encoding="utf-8") as handle:
-            data = json.load(handle)
-    except (OSError, json.JSONDecodeError) as exc:
+        data = jsonio.read_json(path)
+    except (OSError, jsonio.JSONDecodeError) as exc:
         raise error_cls(f"Не удалось прочитать blocks-config {path}: {exc}") from exc
     if not isinstance(data, dict):
         raise error_cls("Файл blocks-config должен содержать объект с ключами сценариев.")
     return data
 
 
+def _clone_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    # Плоской записи (без вложенных dict/list) хватает поверхностной копии.
+    if not any(isinstance(value, (dict, list)) for value in entry.values()):
+        return entry.copy()
+    # Записи blocks-config — чистый JSON: round-trip через jsonio быстрее copy.deepcopy.
+    return jsonio.loads(jsonio.dumps(entry))
+
+
+def _entry_start(entry: Dict[str, Any]) -> float:
+    start = entry.get("start", 0.0)
+    # Обычный случай — float из JSON: без float(... or 0.0) и обработчика исключений.
+    if type(start) is float:
+        return start
+    try:
+        return float(start or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _entry_end(clip: Dict[str, Any]) -> Optional[float]:
+    start = _entry_start(clip)
+    length = clip.get("length")
+    if isinstance(length, (int, float)):
+        return start + float(length)
+    if clip.get("auto_length"):
+        return start
+    return None
+
+
 def _track_end(clips: List[Dict[str, Any]]) -> float:
     end = 0.0
     for clip in clips:
-        try:
-            start = float(clip.get("start", 0.0) or 0.0)
-        except (TypeError, ValueError):
-            start = 0.0
-        length = clip.get("length")
-        if isinstance(length, (int, float)):
-            end = max(end, start + float(length))
-        elif clip.get("auto_length"):
-            end = max(end, start)
+        clip_end = _entry_end(clip)
+        if clip_end is not None:
+            end = max(end, clip_end)
     return end
 
 
 def _shift_starts(entries: Iterable[Dict[str, Any]], shift: float) -> None:
     if shift <= 0:
         return
+    for entry in entries:
+        if isinstance(entry, dict):
+            entry["start"] = round(_entry_start(entry) + shift, 3)
+
+
+def _validate_entries(
+    entries: Any,
+    section: str,
+    error_cls: Type[Exception],
+) -> List[Dict[str, Any]]:
+    """Проверить секцию целиком до изменений спеки: массив объектов."""
+    if not isinstance(entries, list):
+        raise error_cls(f"{section} в blocks-config должен быть массивом.")
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise error_cls(f"Каждый {section} должен быть объектом.")
+    return entries
+
+
+def _validate_prepend(
+    entries: Any,
+    error_cls: Type[Exception],
+) -> List[Tuple[Dict[str, Any], float]]:
+    """Проверка prepend_clips с разбором length: пары (запись, длина)."""
+    if not isinstance(entries, list):
+        raise error_cls("prepend_clips в blocks-config должен быть массивом.")
+    validated: List[Tuple[Dict[str, Any], float]] = []
     for entry in entries:
         if not isinstance(entry, dict):
-            continue
+            raise error_cls("Каждый prepend_clips должен быть объектом.")
+        if "length" not in entry:
+            raise error_cls("Клип в prepend_clips обязан содержать поле length.")
         try:
-            start = float(entry.get("start", 0.0) or 0.0)
-        except (TypeError, ValueError):
-            start = 0.0
-        entry["start"] = round(start + shift, 3)
+            length = float(entry["length"])
+        except (TypeError, ValueError) as exc:
+            raise error_cls("Поле length в prepend_clips должно быть числом.") from exc
+        validated.append((entry, length))
+    return validated
 
 
 def apply_blocks(
@@ -66,20 +118,10 @@ def apply_blocks(
     intro_total = 0.0
     prepend_clips = blocks_cfg.get("prepend_clips", [])
     if prepend_clips:
-        if not isinstance(prepend_clips, list):
-            raise error_cls("prepend_clips в blocks-config должен быть массивом.")
         intro_clips: List[Dict[str, Any]] = []
         offset = 0.0
-        for entry in prepend_clips:
-            if not isinstance(entry, dict):
-                raise error_cls("Каждый prepend_clips должен быть объектом.")
-            clip = copy.deepcopy(entry)
-            if "length" not in clip:
-                raise error_cls("Клип в prepend_clips обязан содержать поле length.")
-            try:
-                length = float(clip["length"])
-            except (TypeError, ValueError) as exc:
-                raise error_cls("Поле length в prepend_clips должно быть числом.") from exc
+        for entry, length in _validate_prepend(prepend_clips, error_cls):
+            clip = _clone_entry(entry)
             clip.setdefault("start", round(offset, 3))
             intro_clips.append(clip)
             offset += length
@@ -88,13 +130,12 @@ def apply_blocks(
             _shift_starts(clips, offset)
             _shift_starts(overlays, offset)
             _shift_starts(spec.get("subtitles", []), offset)
-            clips[:] = intro_clips + clips
+            clips[0:0] = intro_clips
             intro_total = offset
 
     append_clips = blocks_cfg.get("append_clips", [])
     if append_clips:
-        if not isinstance(append_clips, list):
-            raise error_cls("append_clips в blocks-config должен быть массивом.")
+        _validate_entries(append_clips, "append_clips", error_cls)
         timeline_base = _track_end(clips)
         if base_duration and base_duration > 0:
             base_length = base_duration
@@ -102,9 +143,7 @@ def apply_blocks(
             base_length = max(timeline_base - intro_total, 0.0)
         append_offset = 0.0
         for entry in append_clips:
-            if not isinstance(entry, dict):
-                raise error_cls("Каждый append_clips должен быть объектом.")
-            clip = copy.deepcopy(entry)
+            clip = _clone_entry(entry)
             if clip.get("start") is None:
                 clip["start"] = round(intro_total + base_length + append_offset, 3)
             append_offset += float(clip.get("length", 0.0) or 0.0)
@@ -112,12 +151,14 @@ def apply_blocks(
 
     append_overlays = blocks_cfg.get("append_overlays", [])
     if append_overlays:
-        if not isinstance(append_overlays, list):
-            raise error_cls("append_overlays в blocks-config должен быть массивом.")
+        _validate_entries(append_overlays, "append_overlays", error_cls)
+        # Конец дорожки ведём инкрементально, а не пересчитываем на каждый оверлей.
+        overlays_end = _track_end(overlays)
         for entry in append_overlays:
-            if not isinstance(entry, dict):
-                raise error_cls("Каждый append_overlays должен быть объектом.")
-            overlay = copy.deepcopy(entry)
+            overlay = _clone_entry(entry)
             if overlay.get("start") is None:
-                overlay["start"] = round(_track_end(overlays), 3)
+                overlay["start"] = round(overlays_end, 3)
             overlays.append(overlay)
+            overlay_end = _entry_end(overlay)
+            if overlay_end is not None:
+                overlays_end = max(overlays_end, overlay_end)